@@ -0,0 +1,119 @@
+# filepath: admission.py
+"""Admission control for Socket.IO events.
+
+Each sid gets a token bucket per event type, refilled at ``rate`` events per
+second up to ``burst``, and every event type has a maximum payload size
+(measured as JSON). Events over either limit are dropped before their
+handler runs. The sender receives an ``event_rejected`` event naming the
+event and the reason, plus ``retry_after`` seconds when it was rate limited
+so it can defer and resend. Handlers called with an acknowledgement get the
+same error as their ack.
+
+Limits are set with ``SOCKET_RATE_LIMITS`` (``event:rate/burst,...``) and
+``SOCKET_MAX_PAYLOAD`` (``event:bytes,...``); event types not listed are not
+limited, and both are empty by default. Only enable them for clients that
+handle ``event_rejected``. Rejections are counted per event and reason, and exported by
+socket_metrics.
+"""
+import functools
+import threading
+import time
+from flask import request
+from flask_socketio import emit
+from socket_metrics import payload_size, socket_metrics
+
+def parse_limits(value, parse):
+    """Parse ``event:limit,...`` into a dict, converting each limit with ``parse``"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        event, sep, limit = item.partition(':')
+        if not sep or not event:
+            raise ValueError(f'invalid limit {item!r}, expected EVENT:LIMIT')
+        limits[event] = parse(limit)
+    return limits
+
+def parse_rate(value):
+    """Parse ``rate/burst`` (burst defaults to the rate) into a (rate, burst) pair"""
+    rate, _, burst = value.partition('/')
+    rate = float(rate)
+    burst = float(burst) if burst else max(rate, 1.0)
+    if not rate > 0 or burst < 1:
+        raise ValueError(f'invalid rate {value!r}, expected RATE/BURST with RATE > 0 and BURST >= 1')
+    return rate, burst
+
+class AdmissionControl:
+    """Per-sid token buckets and payload limits for Socket.IO events"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}  # sid -> {event: [tokens, clock value of last refill]}
+        self.rates = {}
+        self.max_payload = {}
+        self.rejected = {}  # (event, reason) -> count
+
+    def init_app(self, app):
+        self.rates = parse_limits(app.config['SOCKET_RATE_LIMITS'], parse_rate)
+        self.max_payload = parse_limits(app.config['SOCKET_MAX_PAYLOAD'], int)
+
+    def admit(self, sid, event, data):
+        """Return None if an event is admitted, else (reason, retry_after)"""
+        limit = self.max_payload.get(event)
+        if limit is not None and payload_size(data) > limit:
+            return 'payload_too_large', None
+
+        rate = self.rates.get(event)
+        if rate is None:
+            return None
+        rate, burst = rate
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.setdefault(sid, {}).setdefault(event, [burst, now])
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return None
+            return 'rate_limited', round((1 - bucket[0]) / rate, 3)
+
+    def forget(self, sid):
+        """Drop the buckets of a disconnected sid"""
+        with self._lock:
+            self._buckets.pop(sid, None)
+
+    def limit(self, event):
+        """Decorator dropping events over the limits of ``event``"""
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(data=None, *args, **kwargs):
+                refused = self.admit(request.sid, event, data)
+                if refused is None:
+                    return handler(data, *args, **kwargs)
+                reason, retry_after = refused
+                with self._lock:
+                    self.rejected[(event, reason)] = self.rejected.get((event, reason), 0) + 1
+                socket_metrics.reject(event, reason)
+                error = {'event': event, 'reason': reason}
+                if retry_after is not None:
+                    error['retry_after'] = retry_after
+                emit('event_rejected', error)
+                return dict(error, error=reason)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """Configured limits and rejection counters of this process"""
+        with self._lock:
+            rejected = {}
+            for (event, reason), count in sorted(self.rejected.items()):
+                rejected.setdefault(event, {})[reason] = count
+            return {
+                'rate_limits': {event: {'rate': rate, 'burst': burst}
+                                for event, (rate, burst) in self.rates.items()},
+                'max_payload': dict(self.max_payload),
+                'tracked_sids': len(self._buckets),
+                'rejected': rejected
+            }
+
+# Shared by the Socket.IO handlers of this process
+admission = AdmissionControl()
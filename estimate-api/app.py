@@ -1,26 +1,47 @@
 # filepath: app.py
 import os
 import datetime
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from flask_socketio import SocketIO, join_room, leave_room, emit
 from config import Config
 from database import db, migrate
 from routes import api_bp
-from models import Estimate, db
+from models import Estimate, db, load_estimate_tree
+from presence import presence
+from broadcast import UpdateBroadcaster
+from rollups import rollups_cli
+from transfer import estimates_cli
+from cache import tree_cache
+from instrumentation import profiler
+from socket_metrics import socket_metrics
+from bus import socketio_options
+from oplog import operation_log
+from admission import admission
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config.from_object(Config)
 
 # Initialize extensions
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'X-Save-Stats', 'ETag',
+                          'Server-Timing', 'X-Query-Count', 'X-DB-Time'])
 db.init_app(app)
 migrate.init_app(app, db)
-socketio = SocketIO(app, cors_allowed_origins=Config.CORS_ORIGIN)
+tree_cache.init_app(app)
+profiler.init_app(app)
+presence.init_app(app)
+operation_log.init_app(app)
+admission.init_app(app)
+socketio = SocketIO(app, cors_allowed_origins=Config.CORS_ORIGIN,
+                    **socketio_options(Config.SOCKETIO_MESSAGE_QUEUE))
+socket_metrics.init_app(socketio)
+broadcaster = UpdateBroadcaster(socketio, Config.BROADCAST_COALESCE_MS, socket_metrics)
 
 # Register API routes
 app.register_blueprint(api_bp, url_prefix='/api')
+app.cli.add_command(rollups_cli)
+app.cli.add_command(estimates_cli)
 
 @app.route('/')
 def home():
@@ -30,58 +51,131 @@ def home():
         "status": "running"
     })
 
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify({
+        "tree": tree_cache.stats()
+    })
+
+@app.route('/socket/stats')
+def socket_stats():
+    return jsonify({
+        "broadcast": broadcaster.stats(),
+        "admission": admission.stats()
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Socket.IO metrics for Prometheus"""
+    return Response(socket_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def sweep_stale_editors():
+    """Background task expiring editors whose heartbeats stopped"""
+    while True:
+        socketio.sleep(Config.PRESENCE_SWEEP_INTERVAL)
+        for client_id, estimate_ids in presence.expire(Config.PRESENCE_TIMEOUT).items():
+            for estimate_id in estimate_ids:
+                socket_metrics.broadcast('editor_left', f"estimate_{estimate_id}")
+                socketio.emit('editor_left', {
+                    'client_id': client_id,
+                    'timestamp': datetime.datetime.now().isoformat()
+                }, room=f"estimate_{estimate_id}")
+
+sweeper = None
+
 # Socket.IO handlers for real-time collaboration
 @socketio.on('connect')
 def handle_connect():
+    global sweeper
     print('Client connected')
+    socket_metrics.client_connected()
+    presence.touch(request.sid)
+    if sweeper is None:
+        sweeper = socketio.start_background_task(sweep_stale_editors)
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    from flask import request
     client_id = request.sid
     print(f'Client disconnected: {client_id}')
+    socket_metrics.client_disconnected()
+    admission.forget(client_id)
     
-    # Find all estimates this client was editing and remove them
-    with app.app_context():
-        estimates = Estimate.query.all()
-        for estimate in estimates:
-            if estimate.remove_active_editor(client_id):
-                # Notify others that this editor has left
-                room = f"estimate_{estimate.id}"
-                emit('editor_left', {
-                    'client_id': client_id,
-                    'timestamp': datetime.datetime.now().isoformat()
-                }, room=room)
-                db.session.commit()
+    # Only the rooms this client was in need to hear about it
+    for estimate_id in presence.disconnect(client_id):
+        socket_metrics.broadcast('editor_left', f"estimate_{estimate_id}")
+        emit('editor_left', {
+            'client_id': client_id,
+            'timestamp': datetime.datetime.now().isoformat()
+        }, room=f"estimate_{estimate_id}")
+
+@socketio.on('heartbeat')
+@admission.limit('heartbeat')
+@socket_metrics.track('heartbeat')
+def handle_heartbeat(data=None):
+    """Handler keeping an idle client's presence alive"""
+    presence.touch(request.sid)
 
 @socketio.on('join_estimate')
+@admission.limit('join_estimate')
+@socket_metrics.track('join_estimate')
 def handle_join_estimate(data):
-    """Handler for client joining an estimate session"""
-    from flask import request
+    """Handler for client joining an estimate session.
+
+    A client rejoining with ``last_seq`` receives the operations it missed as
+    ``estimate_catchup``, or ``estimate_snapshot`` when they are no longer
+    logged. Operations broadcast while catching up may arrive twice; clients
+    skip those whose ``seq`` they have seen. Acknowledged with the current
+    sequence number. Unknown estimates are rejected with ``event_rejected``
+    so no presence or log state is kept for them.
+    """
     estimate_id = data.get('estimate_id')
+    last_seq = data.get('last_seq')
     client_id = request.sid
     
-    if not estimate_id:
+    if not estimate_id or not isinstance(estimate_id, str):
         return
     
+    if db.session.execute(db.select(Estimate.id).where(Estimate.id == estimate_id)).first() is None:
+        error = {'event': 'join_estimate', 'reason': 'estimate_not_found', 'estimate_id': estimate_id}
+        emit('event_rejected', error)
+        return dict(error, error='estimate_not_found')
+    
     room = f"estimate_{estimate_id}"
     join_room(room)
     
     # Track the editor
-    with app.app_context():
-        estimate = Estimate.query.get(estimate_id)
-        if estimate and estimate.add_active_editor(client_id):
-            db.session.commit()
-            # Notify others that a new editor has joined
-            emit('editor_joined', {
-                'client_id': client_id,
-                'timestamp': datetime.datetime.now().isoformat()
-            }, room=room, include_self=False)
+    if presence.join(estimate_id, client_id):
+        # Notify others that a new editor has joined
+        socket_metrics.broadcast('editor_joined', room, skip_sid=client_id)
+        emit('editor_joined', {
+            'client_id': client_id,
+            'timestamp': datetime.datetime.now().isoformat()
+        }, room=room, include_self=False)
+
+    # Catch up after joining the room so no operation falls in between
+    if isinstance(last_seq, int) and not isinstance(last_seq, bool):
+        operations = operation_log.since(estimate_id, last_seq)
+        if operations is not None:
+            emit('estimate_catchup', {
+                'estimate_id': estimate_id,
+                'operations': operations,
+                'seq': operations[-1]['seq'] if operations else last_seq
+            })
+        else:
+            seq = operation_log.head(estimate_id)
+            emit('estimate_snapshot', {
+                'estimate_id': estimate_id,
+                'estimate': load_estimate_tree(estimate_id),
+                'seq': seq
+            })
+            return {'seq': seq}
+    return {'seq': operation_log.head(estimate_id)}
 
 @socketio.on('leave_estimate')
+@admission.limit('leave_estimate')
+@socket_metrics.track('leave_estimate')
 def handle_leave_estimate(data):
     """Handler for client leaving an estimate session"""
-    from flask import request
     estimate_id = data.get('estimate_id')
     client_id = request.sid
     
@@ -92,39 +186,46 @@ def handle_leave_estimate(data):
     leave_room(room)
     
     # Remove the editor
-    with app.app_context():
-        estimate = Estimate.query.get(estimate_id)
-        if estimate and estimate.remove_active_editor(client_id):
-            db.session.commit()
-            # Notify others that the editor has left
-            emit('editor_left', {
-                'client_id': client_id,
-                'timestamp': datetime.datetime.now().isoformat()
-            }, room=room)
+    if presence.leave(estimate_id, client_id):
+        # Notify others that the editor has left
+        socket_metrics.broadcast('editor_left', room)
+        emit('editor_left', {
+            'client_id': client_id,
+            'timestamp': datetime.datetime.now().isoformat()
+        }, room=room)
 
 @socketio.on('update_estimate')
+@admission.limit('update_estimate')
+@socket_metrics.track('update_estimate')
 def handle_update(data):
-    """Handler for real-time estimate updates"""
-    from flask import request
+    """Handler for real-time estimate updates.
+
+    Updates are stamped with the next sequence number of the estimate and
+    logged before being broadcast. Acknowledged with that sequence number.
+    """
     estimate_id = data.get('estimate_id')
     update_type = data.get('type')  # epic, story, task, subtask, personnel
     update_action = data.get('action')  # add, update, delete
     update_data = data.get('data')
     client_id = request.sid
+    presence.touch(client_id)
     
     if not estimate_id or not update_type or not update_action or not update_data:
         return
     
     room = f"estimate_{estimate_id}"
     
-    # Broadcast the update to other clients
-    emit('estimate_updated', {
+    update = operation_log.append(estimate_id, {
         'type': update_type,
         'action': update_action,
         'data': update_data,
         'client_id': client_id,
         'timestamp': datetime.datetime.now().isoformat()
-    }, room=room, include_self=False)
+    })
+
+    # Broadcast the update to other clients
+    broadcaster.publish(room, update, sender=client_id)
+    return {'seq': update['seq']}
 
 if __name__ == '__main__':
     with app.app_context():
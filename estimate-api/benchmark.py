@@ -0,0 +1,253 @@
+# filepath: benchmark.py
+"""Benchmark the estimate endpoints on synthetic estimates.
+
+Estimates of a parametric shape are created, read, saved and listed, and
+drafts saved and listed, through the Flask test client against a scratch
+SQLite database. Each operation reports latency percentiles, queries per
+request and the peak memory allocated by one run, as JSON:
+
+    python benchmark.py --shape 4x5x5x3 --personnel 3 --runs 20 --output after.json
+    python benchmark.py --compare before.json
+
+The shape is epics x stories per epic x tasks per story x subtasks per
+task, with ``--personnel`` rows on every node. Latency is measured without
+tracing, after one warm-up run; peak memory comes from one extra traced run
+of each operation. The encoded tree cache is off unless ``--tree-cache`` is
+given, so reads measure loading the tree.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+ROLES = ('DEV', 'BA', 'TESTER', 'PM', 'QA')
+OPERATIONS = ('create', 'read', 'save', 'list', 'draft_save', 'draft_list')
+
+def parse_shape(value):
+    """Parse ``EPICSxSTORIESxTASKSxSUBTASKS`` into four counts"""
+    try:
+        shape = tuple(int(part) for part in value.lower().split('x'))
+    except ValueError:
+        shape = ()
+    if len(shape) != 4 or min(shape) < 0:
+        raise argparse.ArgumentTypeError(f'invalid shape {value!r}, expected e.g. 4x5x5x3')
+    return shape
+
+def synthetic_estimate(shape, personnel, rng):
+    """An estimate payload of the given shape with fresh ids and random values"""
+    epics, stories, tasks, subtasks = shape
+
+    def node(name, children_key=None, children=()):
+        data = {
+            'id': str(uuid.uuid4()),
+            'name': name,
+            'personnel': [{'type': ROLES[i % len(ROLES)], 'value': float(rng.randint(1, 20))}
+                          for i in range(personnel)]
+        }
+        if children_key:
+            data[children_key] = list(children)
+        return data
+
+    return {
+        'id': str(uuid.uuid4()),
+        'project_name': 'Benchmark',
+        'start_date': '2026-01-05',
+        'is_draft': False,
+        'epics': [node(f'Epic {e}', 'stories', (
+            node(f'Story {e}.{s}', 'tasks', (
+                node(f'Task {e}.{s}.{t}', 'subTasks', (
+                    node(f'Subtask {e}.{s}.{t}.{u}') for u in range(subtasks)
+                )) for t in range(tasks)
+            )) for s in range(stories)
+        )) for e in range(epics)]
+    }
+
+def shape_size(shape, personnel):
+    """Number of nodes and personnel rows of one estimate"""
+    epics, stories, tasks, subtasks = shape
+    nodes = epics * (1 + stories * (1 + tasks * (1 + subtasks)))
+    return nodes, nodes * personnel
+
+def bump_values(epics):
+    """Add one to every personnel value of a tree, in place"""
+    for node in epics:
+        for p in node['personnel']:
+            p['value'] = (p['value'] or 0) + 1
+        for key in ('stories', 'tasks', 'subTasks'):
+            bump_values(node.get(key, ()))
+
+class Runner:
+    """Times requests made with the test client and counts their queries"""
+
+    def __init__(self, client, engine):
+        from sqlalchemy import event
+        self.client = client
+        self.queries = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.queries += 1
+
+    def request(self, method, path, expected, **kwargs):
+        """Make a request, reading streamed bodies to the end. Returns (ms, queries, response)"""
+        self.queries = 0
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, **kwargs)
+        response.get_data()
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != expected:
+            raise RuntimeError(f'{method} {path} returned {response.status_code}: '
+                               f'{response.get_data(as_text=True)[:200]}')
+        return elapsed, self.queries, response
+
+def summarize(samples, queries, peak):
+    from instrumentation import percentile
+    samples = sorted(samples)
+    return {
+        'runs': len(samples),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        **{f'p{p}_ms': round(percentile(samples, p), 3) for p in (50, 90, 99)},
+        'max_ms': round(samples[-1], 3),
+        'queries': {'min': min(queries), 'max': max(queries)},
+        'peak_kib': round(peak / 1024, 1)
+    }
+
+def run_benchmark(app, db, shape, personnel, runs, seed):
+    """Run every operation ``runs`` times (plus a warm-up and a traced run) and return their stats"""
+    rng = random.Random(seed)
+    samples = {name: ([], []) for name in OPERATIONS}
+    peaks = {}
+    ids = []
+    saved = {}
+
+    def create():
+        payload = synthetic_estimate(shape, personnel, rng)
+        result = runner.request('POST', '/api/estimates', 201, json=payload)
+        ids.append(payload['id'])
+        return result
+
+    def read():
+        return runner.request('GET', f'/api/estimates/{ids[0]}', 200)
+
+    def save():
+        bump_values(saved['epics'])
+        return runner.request('PUT', f'/api/estimates/{ids[0]}', 200, json={'epics': saved['epics']})
+
+    def list_estimates():
+        return runner.request('GET', '/api/estimates', 200)
+
+    def draft_save():
+        bump_values(saved['epics'])
+        return runner.request('POST', f'/api/estimates/{ids[0]}/drafts', 201,
+                              json={'name': 'Benchmark draft', 'estimate_data': saved})
+
+    def draft_list():
+        return runner.request('GET', f'/api/estimates/{ids[0]}/drafts', 200)
+
+    operations = dict(zip(OPERATIONS, (create, read, save, list_estimates, draft_save, draft_list)))
+    with app.app_context():
+        runner = Runner(app.test_client(), db.engine)
+        for name, operation in operations.items():
+            # The first run warms up mappers and caches and is not timed
+            for i in range(runs + 2):
+                traced = i == runs + 1
+                if traced:
+                    tracemalloc.start()
+                try:
+                    elapsed, queries, response = operation()
+                finally:
+                    if traced:
+                        peaks[name] = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                if 0 < i <= runs:
+                    samples[name][0].append(elapsed)
+                    samples[name][1].append(queries)
+                if name == 'read' and not saved:
+                    saved.update(response.get_json())
+            db.session.remove()
+
+    return {name: summarize(*samples[name], peaks[name]) for name in OPERATIONS}
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report, baseline):
+    """Print the p50 latency and query changes of ``report`` against ``baseline``"""
+    if baseline.get('shape') != report['shape'] or baseline.get('personnel') != report['personnel']:
+        print('warning: baseline was run with a different shape', file=sys.stderr)
+    print(f'{"operation":<12} {"p50 before":>11} {"p50 after":>10} {"change":>8} {"queries":>12}',
+          file=sys.stderr)
+    for name, stats in report['operations'].items():
+        before = baseline.get('operations', {}).get(name)
+        if before is None:
+            continue
+        change = (stats['p50_ms'] / before['p50_ms'] - 1) * 100 if before['p50_ms'] else 0
+        print(f'{name:<12} {before["p50_ms"]:>9.2f}ms {stats["p50_ms"]:>8.2f}ms {change:>+7.1f}% '
+              f'{before["queries"]["max"]:>5} -> {stats["queries"]["max"]:<4}', file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shape', type=parse_shape, default=(3, 4, 4, 3),
+                        help='epics x stories x tasks x subtasks (default 3x4x4x3)')
+    parser.add_argument('--personnel', type=int, default=3, help='personnel rows per node')
+    parser.add_argument('--runs', type=int, default=20, help='timed runs per operation')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic values')
+    parser.add_argument('--tree-cache', action='store_true', help='keep the encoded tree cache on')
+    parser.add_argument('--output', help='write the report to this file instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='print changes against an earlier report')
+    args = parser.parse_args()
+    if args.runs < 1 or args.personnel < 0:
+        parser.error('--runs must be positive and --personnel not negative')
+
+    # The app reads its configuration on import
+    workdir = tempfile.mkdtemp(prefix='estimate-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    os.environ['SLOW_REQUEST_MS'] = 'inf'
+    if not args.tree_cache:
+        os.environ['TREE_CACHE_MAX_BYTES'] = '0'
+    from app import app
+    from models import db
+    with app.app_context():
+        db.create_all()
+
+    nodes, rows = shape_size(args.shape, args.personnel)
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'shape': 'x'.join(map(str, args.shape)),
+        'personnel': args.personnel,
+        'nodes': nodes,
+        'personnel_rows': rows,
+        'tree_cache': args.tree_cache,
+        'operations': run_benchmark(app, db, args.shape, args.personnel, args.runs, args.seed)
+    }
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# filepath: broadcast.py
+"""Room broadcasting of real-time estimate updates.
+
+With a zero window every update is re-emitted to its room straight away as
+``estimate_updated``. With a positive window, updates for a room are buffered
+for that many milliseconds, repeated updates of the same (type, id, field)
+collapse to the latest one, and the room receives a single
+``estimate_updated_batch`` event. Senders find their own updates in a batch
+by ``client_id``. Each emit reports its fan-out to the optional ``metrics``.
+"""
+import datetime
+import threading
+
+class UpdateBroadcaster:
+    """Fans update_estimate events out to estimate rooms"""
+
+    def __init__(self, socketio, window_ms=0, metrics=None):
+        self.socketio = socketio
+        self.metrics = metrics
+        self.window = window_ms / 1000.0
+        self._lock = threading.Lock()
+        self._pending = {}  # room -> {coalescing key: update}, in arrival order
+        self.events_in = 0
+        self.events_out = 0
+        self.updates_out = 0
+        self.collapsed = 0
+
+    def publish(self, room, update, sender=None):
+        """Broadcast an update to everyone in ``room`` except ``sender``"""
+        with self._lock:
+            self.events_in += 1
+            if self.window <= 0:
+                self.events_out += 1
+                self.updates_out += 1
+            else:
+                self._buffer(room, update)
+                return
+        if self.metrics is not None:
+            self.metrics.broadcast('estimate_updated', room, skip_sid=sender)
+        self.socketio.emit('estimate_updated', update, room=room, skip_sid=sender)
+
+    def _buffer(self, room, update):
+        first = room not in self._pending
+        pending = self._pending.setdefault(room, {})
+        key = self._key(update) or object()
+        if key in pending:
+            # Re-insert so the latest value keeps its place after any
+            # add/delete that arrived in between
+            del pending[key]
+            self.collapsed += 1
+        pending[key] = update
+        if first:
+            self.socketio.start_background_task(self._flush_later, room)
+
+    @staticmethod
+    def _key(update):
+        """Updates sharing a key supersede each other; adds and deletes never collapse"""
+        if update.get('action') != 'update':
+            return None
+        data = update.get('data')
+        if not isinstance(data, dict):
+            data = {}
+        return (update.get('type'), data.get('id'), data.get('field'))
+
+    def _flush_later(self, room):
+        self.socketio.sleep(self.window)
+        self.flush(room)
+
+    def flush(self, room):
+        """Emit the buffered updates of a room as one batch"""
+        with self._lock:
+            pending = self._pending.pop(room, None)
+            if not pending:
+                return
+            updates = list(pending.values())
+            self.events_out += 1
+            self.updates_out += len(updates)
+        if self.metrics is not None:
+            self.metrics.broadcast('estimate_updated_batch', room)
+        self.socketio.emit('estimate_updated_batch', {
+            'updates': updates,
+            'timestamp': datetime.datetime.now().isoformat()
+        }, room=room)
+
+    def stats(self):
+        """Counters of events received versus events emitted"""
+        with self._lock:
+            return {
+                'window_ms': int(self.window * 1000),
+                'events_in': self.events_in,
+                'events_out': self.events_out,
+                'updates_out': self.updates_out,
+                'collapsed': self.collapsed,
+                'pending_rooms': len(self._pending)
+            }
@@ -0,0 +1,82 @@
+# filepath: bus.py
+"""Message bus connecting the Socket.IO servers of several workers.
+
+Room broadcasts go through a pub/sub client manager so every worker delivers
+them to its own clients. ``SOCKETIO_MESSAGE_QUEUE`` picks the backend:
+
+    (empty)                 single process, rooms kept in memory (default)
+    sqlite:///<path>        SQLite file shared by the workers of one host
+    redis://, amqp://, ...  any message queue supported by Flask-SocketIO
+
+The SQLite bus needs no external service: messages are appended to a table
+that every worker polls, and rows older than a minute are pruned. Use a
+broker such as Redis to span several hosts. Presence and the operation log
+are shared separately, see ``PRESENCE_URL`` and ``OPLOG_URL``.
+"""
+import sqlite3
+import threading
+import time
+import socketio
+
+# Seconds between polls of the SQLite bus and before published rows are pruned
+POLL_INTERVAL = 0.01
+RETENTION = 60
+
+class SQLiteManager(socketio.PubSubManager):
+    """Socket.IO client manager publishing through a shared SQLite table"""
+    name = 'sqlite'
+
+    def __init__(self, path, channel='flask-socketio', write_only=False, logger=None,
+                 poll_interval=POLL_INTERVAL, retention=RETENTION):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS bus_message ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT, created REAL, payload TEXT)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_bus_message_created ON bus_message (created)')
+        # Only messages published from now on are delivered
+        self._last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM bus_message').fetchone()[0]
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _publish(self, data):
+        self._connect().execute(
+            'INSERT INTO bus_message (channel, created, payload) VALUES (?, ?, ?)',
+            (self.channel, time.time(), self.json.dumps(data))
+        )
+
+    def _listen(self):
+        conn = self._connect()
+        pruned = time.monotonic()
+        while True:
+            rows = conn.execute(
+                'SELECT id, payload FROM bus_message WHERE id > ? AND channel = ? ORDER BY id',
+                (self._last_id, self.channel)
+            ).fetchall()
+            for message_id, payload in rows:
+                self._last_id = message_id
+                yield payload
+            if time.monotonic() - pruned > self.retention / 2:
+                conn.execute('DELETE FROM bus_message WHERE created < ?', (time.time() - self.retention,))
+                pruned = time.monotonic()
+            if not rows:
+                self.server.sleep(self.poll_interval)
+
+def socketio_options(url):
+    """Keyword arguments of SocketIO for a SOCKETIO_MESSAGE_QUEUE url"""
+    if not url:
+        return {}
+    if url.startswith('sqlite:///'):
+        return {'client_manager': SQLiteManager(url[len('sqlite:///'):])}
+    return {'message_queue': url}
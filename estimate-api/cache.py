@@ -0,0 +1,206 @@
+# filepath: cache.py
+"""Cache of encoded estimate trees served by ``GET /api/estimates/<id>``.
+
+Entries hold the JSON body exactly as ``jsonify`` produced it plus a gzipped
+copy, and are tagged with the estimate version and the editors present when
+they were built. A lookup only hits when both still match, so a stale body is
+never served even if an invalidation is missed; every write path still
+invalidates explicitly to free the space straight away.
+
+Backends are chosen with ``TREE_CACHE_URL``:
+
+    memory://               per-process LRU (default)
+    sqlite:///<path>        LRU in a SQLite file shared by the workers of a host
+
+Both evict least recently used entries once ``TREE_CACHE_MAX_BYTES`` is
+exceeded; a size of 0 disables the cache.
+"""
+import gzip
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class MemoryBackend:
+    """In-process LRU bounded by the total size of its entries"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, entry, size):
+        """Store an entry and return how many others were evicted for it"""
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (entry, size)
+            self._size += size
+            evicted = 0
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                evicted += 1
+            return evicted
+
+    def delete(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._size -= item[1]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size}
+
+class SQLiteBackend:
+    """LRU kept in a SQLite file so every worker process on a host shares it"""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tree_cache ('
+                'key TEXT PRIMARY KEY, version INTEGER, editors TEXT, '
+                'body BLOB, gzipped BLOB, size INTEGER, used REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_tree_cache_used ON tree_cache (used)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT version, editors, body, gzipped FROM tree_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE tree_cache SET used = ? WHERE key = ?', (time.time(), key))
+        return (row[0], tuple(json.loads(row[1])), row[2], row[3])
+
+    def set(self, key, entry, size):
+        version, editors, body, gzipped = entry
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO tree_cache VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, version, json.dumps(list(editors)), body, gzipped, size, time.time())
+            )
+            evicted = 0
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM tree_cache').fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, old_size in conn.execute(
+                    'SELECT key, size FROM tree_cache ORDER BY used'
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute('DELETE FROM tree_cache WHERE key = ?', (old_key,))
+                    total -= old_size
+                    evicted += 1
+            conn.execute('COMMIT')
+            return evicted
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM tree_cache WHERE key = ?', (key,))
+
+    def stats(self):
+        entries, size = self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tree_cache'
+        ).fetchone()
+        return {'entries': entries, 'bytes': size}
+
+def make_backend(url, max_bytes):
+    """Build the backend named by a TREE_CACHE_URL"""
+    if url in ('', 'memory://'):
+        return MemoryBackend(max_bytes)
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):], max_bytes)
+    raise ValueError(f'Unsupported TREE_CACHE_URL: {url}')
+
+class TreeCache:
+    """Encoded estimate trees keyed by estimate id"""
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        max_bytes = app.config['TREE_CACHE_MAX_BYTES']
+        self.backend = make_backend(app.config['TREE_CACHE_URL'], max_bytes) if max_bytes > 0 else None
+
+    def get(self, estimate_id, version, editors):
+        """Return (body, gzipped) for this version and set of editors, or None"""
+        if self.backend is None:
+            return None
+        entry = self.backend.get(estimate_id)
+        hit = entry is not None and entry[0] == version and entry[1] == tuple(editors)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry[2:] if hit else None
+
+    def put(self, estimate_id, version, editors, body):
+        """Cache an encoded tree and return (body, gzipped); gzipped is None when disabled"""
+        if self.backend is None:
+            return body, None
+        gzipped = gzip.compress(body, 6, mtime=0)
+        size = len(body) + len(gzipped)
+        if size <= self.backend.max_bytes:
+            evicted = self.backend.set(estimate_id, (version, tuple(editors), body, gzipped), size)
+            with self._lock:
+                self.evictions += evicted
+        return body, gzipped
+
+    def invalidate(self, estimate_id):
+        """Drop the entry of an estimate after a write"""
+        if self.backend is None:
+            return
+        self.backend.delete(estimate_id)
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        """Hit, miss, eviction and invalidation counters of this process"""
+        with self._lock:
+            stats = {
+                'enabled': self.backend is not None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+        if self.backend is not None:
+            stats.update(self.backend.stats(), max_bytes=self.backend.max_bytes)
+        return stats
+
+# Shared by the routes and the maintenance commands of this process
+tree_cache = TreeCache()
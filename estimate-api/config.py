@@ -7,4 +7,39 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///estimate.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    CORS_ORIGIN = os.environ.get('CORS_ORIGIN', '*')
\ No newline at end of file
+    CORS_ORIGIN = os.environ.get('CORS_ORIGIN', '*')
+    # Seconds without events or heartbeats before an editor is dropped
+    PRESENCE_TIMEOUT = float(os.environ.get('PRESENCE_TIMEOUT', 90))
+    PRESENCE_SWEEP_INTERVAL = float(os.environ.get('PRESENCE_SWEEP_INTERVAL', 30))
+    # Socket.IO admission control: per-sid EVENT:RATE/BURST token buckets and EVENT:BYTES payload limits,
+    # e.g. update_estimate:20/40 and update_estimate:65536 (empty disables; clients must handle event_rejected)
+    SOCKET_RATE_LIMITS = os.environ.get('SOCKET_RATE_LIMITS', '')
+    SOCKET_MAX_PAYLOAD = os.environ.get('SOCKET_MAX_PAYLOAD', '')
+    # Multi-worker mode: Socket.IO message bus (sqlite:///<path>, redis://...) and shared presence
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+    PRESENCE_URL = os.environ.get('PRESENCE_URL', 'memory://')
+    # Operation log replayed to rejoining editors: memory:// or sqlite:///<path>, operations kept per estimate
+    OPLOG_URL = os.environ.get('OPLOG_URL', 'memory://')
+    OPLOG_SIZE = int(os.environ.get('OPLOG_SIZE', 1000))
+    # Buffer update_estimate broadcasts per room for this many ms (0 disables)
+    BROADCAST_COALESCE_MS = int(os.environ.get('BROADCAST_COALESCE_MS', 0))
+    # Store draft snapshots as deltas against the previous draft, up to this chain length (0 disables)
+    DRAFT_DELTA_MAX_DEPTH = int(os.environ.get('DRAFT_DELTA_MAX_DEPTH', 0))
+    # Schedule projection defaults: people per role, working days (Monday first) and holidays
+    SCHEDULE_DEFAULT_CAPACITY = float(os.environ.get('SCHEDULE_DEFAULT_CAPACITY', 1))
+    SCHEDULE_WEEKMASK = os.environ.get('SCHEDULE_WEEKMASK', '1111100')
+    SCHEDULE_HOLIDAYS = os.environ.get('SCHEDULE_HOLIDAYS', '')
+    # Encoded estimate tree cache: memory:// or sqlite:///<path> shared by workers; 0 bytes disables
+    TREE_CACHE_URL = os.environ.get('TREE_CACHE_URL', 'memory://')
+    TREE_CACHE_MAX_BYTES = int(os.environ.get('TREE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # Request profiling: timing headers, slow request log threshold, statements logged, metrics window
+    PROFILE_HEADERS = os.environ.get('PROFILE_HEADERS', '').lower() in ('1', 'true', 'yes')
+    SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+    PROFILE_SLOWEST = int(os.environ.get('PROFILE_SLOWEST', 5))
+    METRICS_WINDOW = int(os.environ.get('METRICS_WINDOW', 1000))
+    # Monte Carlo forecast defaults: trials, spread of each value (as multipliers) and limits
+    FORECAST_TRIALS = int(os.environ.get('FORECAST_TRIALS', 10000))
+    FORECAST_MAX_TRIALS = int(os.environ.get('FORECAST_MAX_TRIALS', 100000))
+    FORECAST_LOW = float(os.environ.get('FORECAST_LOW', 0.8))
+    FORECAST_HIGH = float(os.environ.get('FORECAST_HIGH', 1.5))
+    FORECAST_MAX_WORKERS = int(os.environ.get('FORECAST_MAX_WORKERS', os.cpu_count() or 1))
\ No newline at end of file
@@ -0,0 +1,61 @@
+# filepath: explain_queries.py
+"""Print the query plans of the statements on the hot read and save paths.
+
+Run against the configured DATABASE_URL (SQLite or PostgreSQL) after
+``flask db upgrade`` to confirm the statements use the hot query indexes:
+
+    python explain_queries.py
+"""
+from app import app
+from models import (db, Estimate, Epic, Story, Task, Subtask, Personnel, Draft, Rollup,
+                    join_to_epic, personnel_union)
+
+# Plans do not depend on the literal values, so placeholders are enough
+SAMPLE_ID = '00000000-0000-0000-0000-000000000000'
+
+def hot_statements():
+    """The statements issued per estimate read, save and listing"""
+    return [
+        ('personnel of one node', db.select(Personnel).where(
+            Personnel.entity_type == 'task', Personnel.entity_id == SAMPLE_ID)),
+        ('epics of an estimate', db.select(Epic).where(Epic.estimate_id == SAMPLE_ID)),
+        ('stories of an epic', db.select(Story).where(Story.epic_id == SAMPLE_ID)),
+        ('tasks of a story', db.select(Task).where(Task.story_id == SAMPLE_ID)),
+        ('subtasks of a task', db.select(Subtask).where(Subtask.task_id == SAMPLE_ID)),
+        ('subtasks of an estimate', join_to_epic(
+            db.select(Subtask.id, Subtask.name, Subtask.task_id), Subtask
+        ).where(Epic.estimate_id == SAMPLE_ID)),
+        ('personnel of an estimate', personnel_union(
+            (Personnel.id, Personnel.type, Personnel.value,
+             Personnel.entity_type, Personnel.entity_id),
+            Epic.estimate_id == SAMPLE_ID
+        )),
+        ('rollups of an estimate', db.select(Rollup).where(Rollup.estimate_id == SAMPLE_ID)),
+        ('rollups of one node', db.select(Rollup.type, Rollup.total).where(
+            Rollup.entity_type == 'task', Rollup.entity_id == SAMPLE_ID)),
+        ('drafts of an estimate', db.select(Draft.id, Draft.name).where(
+            Draft.estimate_id == SAMPLE_ID)),
+        ('estimate listing page', db.select(Estimate.id, Estimate.project_name)
+            .order_by(Estimate.created_at, Estimate.id).limit(50)),
+    ]
+
+def explain(statement):
+    """Return the plan of a statement as a list of text lines"""
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).all()
+        return [f'{row.id:>3} {row.parent:>3}  {row.detail}' for row in rows]
+    rows = db.session.execute(db.text(f'EXPLAIN {sql}')).all()
+    return [row[0] for row in rows]
+
+def main():
+    with app.app_context():
+        print(f'Database: {db.engine.url.render_as_string(hide_password=True)}')
+        for label, statement in hot_statements():
+            print(f'\n-- {label}')
+            for line in explain(statement):
+                print(f'   {line}')
+
+if __name__ == '__main__':
+    main()
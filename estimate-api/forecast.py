@@ -0,0 +1,157 @@
+# filepath: forecast.py
+"""Monte Carlo forecast of estimate effort and completion dates.
+
+Every personnel value is taken as the most likely effort of a distribution
+running from ``low`` to ``high`` times that value (PERT or triangular).
+Trials are simulated in batches of array operations: one matrix of
+multipliers (trials x personnel rows) per batch, reduced to effort per
+(epic, role) with a single ``add.reduceat``. Completion follows the schedule
+model: each role works through the epics in order, all roles in parallel,
+and an epic completes when the slowest role with work in it gets there.
+
+Batches draw from child seeds spawned off one ``SeedSequence``, so a seed
+gives the same forecast whether the batches run in this process or across a
+process pool.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from schedule import flatten_tree, working_calendar
+
+DISTRIBUTIONS = ('pert', 'triangular')
+PERCENTILES = (50, 80, 95)
+
+# Upper bound on samples held in memory per batch (trials x personnel rows)
+BATCH_CELLS = 2000000
+
+def sample_multipliers(rng, distribution, low, high, shape):
+    """Draw effort multipliers between ``low`` and ``high`` with their mode at 1"""
+    if high == low:
+        return np.ones(shape)
+    if distribution == 'triangular':
+        return rng.triangular(low, 1.0, high, size=shape)
+    # PERT: a beta distribution rescaled to [low, high]
+    alpha = 1 + 4 * (1 - low) / (high - low)
+    beta = 1 + 4 * (high - 1) / (high - low)
+    return low + rng.beta(alpha, beta, size=shape) * (high - low)
+
+def simulate_batch(seed, trials, values, starts, distribution, low, high):
+    """Simulate a batch of trials and return their effort per group.
+
+    ``values`` are the personnel values sorted by group and ``starts`` the
+    position of the first value of each group. Returns an array of shape
+    (trials, groups).
+    """
+    rng = np.random.default_rng(seed)
+    samples = sample_multipliers(rng, distribution, low, high, (trials, len(values))) * values
+    return np.add.reduceat(samples, starts, axis=1)
+
+def run_forecast(tree, trials=10000, distribution='pert', low=0.8, high=1.5, seed=None,
+                 workers=1, percentiles=PERCENTILES, capacity=None, default_capacity=1.0,
+                 weekmask='1111100', holidays=(), start=None):
+    """Forecast effort and completion of an estimate tree.
+
+    ``tree`` is the dict returned by ``load_estimate_tree``. The calendar
+    arguments are those of ``project_schedule``. With ``workers`` above one
+    the batches are spread over a process pool. Returns percentiles of
+    effort (person-days) and completion (working days and date) for the
+    estimate, per role and per epic, along with the seed used. Raises
+    ValueError on invalid arguments.
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f'distribution must be one of {", ".join(DISTRIBUTIONS)}')
+    if not 0 <= low <= 1 <= high:
+        raise ValueError('spread must satisfy 0 <= low <= 1 <= high')
+    if trials < 1:
+        raise ValueError('trials must be positive')
+    percentiles = [float(p) for p in percentiles]
+    if not percentiles or not all(0 <= p <= 100 for p in percentiles):
+        raise ValueError('percentiles must be between 0 and 100')
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    seed = int(seed)
+    if seed < 0:
+        raise ValueError('seed must not be negative')
+    capacity = capacity or {}
+    if not default_capacity > 0:
+        raise ValueError('default capacity must be positive')
+    calendar, origin = working_calendar(start or tree['start_date'], weekmask, holidays)
+
+    nodes, _, (indexes, types, values) = flatten_tree(tree)
+    roles = sorted(set(types))
+    role_index = {role: i for i, role in enumerate(roles)}
+    epic_rows = np.array([i for i, (level, _, _) in enumerate(nodes) if level == 'epic'], dtype=int)
+    epics = [nodes[i][1] for i in epic_rows]
+
+    # Group personnel rows by (epic, role); each node belongs to the last
+    # epic that starts at or before it in depth-first order
+    epic_of = np.searchsorted(epic_rows, np.array(indexes, dtype=int), side='right') - 1
+    groups = epic_of * len(roles) + np.array([role_index[t] for t in types], dtype=int)
+    values = np.clip(np.array(values, dtype=float), 0, None)
+    order = np.argsort(groups, kind='stable')
+    present, starts = np.unique(groups[order], return_index=True)
+    has_work = (np.bincount(groups, weights=values, minlength=len(epics) * len(roles)) > 0)
+    has_work = has_work.reshape(len(epics), len(roles))
+
+    batch = max(1, BATCH_CELLS // max(len(values), 1))
+    sizes = [min(batch, trials - offset) for offset in range(0, trials, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    effort = np.zeros((trials, len(epics) * len(roles)))
+    if len(values):
+        jobs = [(child, size, values[order], starts, distribution, low, high)
+                for child, size in zip(seeds, sizes)]
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(simulate_batch, *zip(*jobs)))
+        else:
+            results = [simulate_batch(*job) for job in jobs]
+        effort[:, present] = np.concatenate(results)
+    effort = effort.reshape(trials, len(epics), len(roles))
+
+    # Working days at which each role reaches the end of each epic
+    people = np.array([capacity.get(role, default_capacity) for role in roles])
+    finish = np.cumsum(effort, axis=1) / people
+    epic_finish = np.where(has_work, finish, 0).max(axis=2, initial=0)
+    role_finish = finish[:, -1, :] if len(epics) else np.zeros((trials, len(roles)))
+    completion = role_finish.max(axis=1, initial=0)
+
+    labels = [f'P{p:g}' for p in percentiles]
+
+    def days_to_date(days):
+        last_day = max(int(np.ceil(round(days, 6))) - 1, 0)
+        return {
+            'working_days': round(float(days), 2),
+            'date': str(np.busday_offset(origin, last_day, busdaycal=calendar)) if days > 0 else None
+        }
+
+    def effort_stats(samples):
+        return dict(zip(labels, np.round(np.percentile(samples, percentiles), 2).tolist()))
+
+    def completion_stats(samples):
+        return dict(zip(labels, map(days_to_date, np.percentile(samples, percentiles))))
+
+    return {
+        'estimate_id': tree['id'],
+        'trials': trials,
+        'seed': seed,
+        'distribution': distribution,
+        'spread': {'low': low, 'high': high},
+        'start': str(origin),
+        'completion': completion_stats(completion),
+        'roles': {
+            role: {
+                'effort': effort_stats(effort[:, :, r].sum(axis=1)),
+                'completion': completion_stats(role_finish[:, r])
+            } for r, role in enumerate(roles)
+        },
+        'epics': [{
+            'id': epic['id'],
+            'name': epic['name'],
+            'completion': completion_stats(epic_finish[:, e]) if has_work[e].any() else None,
+            'roles': {
+                role: {
+                    'effort': effort_stats(effort[:, e, r]),
+                    'completion': completion_stats(finish[:, e, r])
+                } for r, role in enumerate(roles) if has_work[e, r]
+            }
+        } for e, epic in enumerate(epics)]
+    }
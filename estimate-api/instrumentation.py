@@ -0,0 +1,138 @@
+# filepath: instrumentation.py
+"""Per-request SQL instrumentation and slow-request logging.
+
+Cursor events of every SQLAlchemy engine are timed and attributed to the
+Flask request being served. When a request finishes:
+
+- with ``PROFILE_HEADERS`` enabled, its query count and DB time are sent in
+  ``Server-Timing``, ``X-Query-Count`` and ``X-DB-Time`` headers (streamed
+  responses only report the work done before the body started);
+- if it took longer than ``SLOW_REQUEST_MS`` it is logged with its slowest
+  statements;
+- its wall time, DB time and query count join a sliding window per endpoint,
+  summarized as percentiles by ``GET /api/_metrics``.
+"""
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PERCENTILES = (50, 90, 99)
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    rank = math.ceil(p / 100.0 * len(values)) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+class RequestProfiler:
+    """Collects SQL statistics per request and aggregates them per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = defaultdict(lambda: deque(maxlen=self.window))
+        self._requests = defaultdict(int)
+        self._slow = defaultdict(int)
+        self.window = 1000
+        self.slowest = 5
+        self.slow_ms = 500
+        self.headers = False
+        self.logger = None
+
+    def init_app(self, app):
+        self.window = app.config['METRICS_WINDOW']
+        self.slowest = app.config['PROFILE_SLOWEST']
+        self.slow_ms = app.config['SLOW_REQUEST_MS']
+        self.headers = app.config['PROFILE_HEADERS']
+        self.logger = app.logger
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g.sql_profile = {'started': time.perf_counter(), 'count': 0, 'time': 0.0, 'statements': []}
+
+    @staticmethod
+    def _current():
+        if not has_request_context():
+            return None
+        return g.get('sql_profile')
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current() is not None:
+            conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = self._current()
+        if profile is None or not conn.info.get('profile_started'):
+            return
+        elapsed = time.perf_counter() - conn.info['profile_started'].pop()
+        profile['count'] += 1
+        profile['time'] += elapsed
+        profile['statements'].append((elapsed, statement))
+
+    def _after_request(self, response):
+        profile = self._current()
+        if profile is not None and self.headers:
+            db_ms = profile['time'] * 1000
+            total_ms = (time.perf_counter() - profile['started']) * 1000
+            response.headers['Server-Timing'] = (
+                f'db;dur={db_ms:.1f};desc="{profile["count"]} queries", app;dur={total_ms:.1f}'
+            )
+            response.headers['X-Query-Count'] = str(profile['count'])
+            response.headers['X-DB-Time'] = f'{db_ms:.1f}'
+        return response
+
+    def _teardown_request(self, exc):
+        profile = self._current()
+        if profile is None:
+            return
+        g.pop('sql_profile', None)
+        total_ms = (time.perf_counter() - profile['started']) * 1000
+        rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+        endpoint = f'{request.method} {rule}'
+        slow = total_ms > self.slow_ms
+
+        with self._lock:
+            self._requests[endpoint] += 1
+            self._slow[endpoint] += slow
+            self._windows[endpoint].append((total_ms, profile['time'] * 1000, profile['count']))
+
+        if slow and self.logger is not None:
+            statements = sorted(profile['statements'], key=lambda item: item[0], reverse=True)
+            self.logger.warning(
+                'Slow request %s %s: %.1f ms, %d queries, %.1f ms in DB. Slowest statements:\n%s',
+                request.method, request.full_path.rstrip('?'), total_ms,
+                profile['count'], profile['time'] * 1000,
+                '\n'.join(f'  {elapsed * 1000:8.1f} ms  {" ".join(sql.split())}'
+                          for elapsed, sql in statements[:self.slowest])
+            )
+
+    def snapshot(self):
+        """Percentiles of wall time, DB time and query count per endpoint"""
+        with self._lock:
+            windows = {endpoint: list(samples) for endpoint, samples in self._windows.items()}
+            requests = dict(self._requests)
+            slow = dict(self._slow)
+
+        endpoints = {}
+        for endpoint, samples in sorted(windows.items()):
+            columns = zip(*samples)
+            stats = {'requests': requests[endpoint], 'slow': slow[endpoint], 'window': len(samples)}
+            for name, values in zip(('total_ms', 'db_ms', 'queries'), columns):
+                values = sorted(values)
+                stats[name] = {
+                    f'p{p}': round(percentile(values, p), 2) for p in PERCENTILES
+                }
+                stats[name]['max'] = round(values[-1], 2)
+            endpoints[endpoint] = stats
+        return {'slow_request_ms': self.slow_ms, 'endpoints': endpoints}
+
+# Shared by the app factory and the metrics route
+profiler = RequestProfiler()
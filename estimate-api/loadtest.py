@@ -0,0 +1,344 @@
+# filepath: loadtest.py
+"""Load test of the Socket.IO collaboration protocol.
+
+Starts the app in a child process (or targets ``--url``), connects
+``--clients`` Socket.IO clients spread over ``--rooms`` estimate rooms, and
+has ``--editors`` of them per room send ``update_estimate`` events at
+``--rate`` edits per second each for ``--duration`` seconds. Every update
+carries its sender, sequence number and send time, so receivers can measure
+end-to-end broadcast latency and count dropped, duplicated and out-of-order
+deliveries. The report also includes server CPU per event received and per
+message delivered. CPU is only reported when this tool starts the server.
+
+    python loadtest.py --clients 300 --rooms 30 --editors 3 --rate 2 --duration 20
+
+With ``--workers`` above one, that many servers are started sharing a SQLite
+message bus, presence and operation log (unless ``SOCKETIO_MESSAGE_QUEUE``,
+``PRESENCE_URL`` and ``OPLOG_URL`` name others), and the members of every
+room are spread over them. ``--url`` can be repeated to do the same against running workers.
+
+Clients need the Socket.IO client transports: ``pip install requests
+websocket-client``. Updates use a distinct field each, so with
+``BROADCAST_COALESCE_MS`` set (``--coalesce-ms``) they are batched but never
+collapsed, and latency includes the coalescing window.
+"""
+import argparse
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+def serve(port, workdir, coalesce_ms, workers, control):
+    """Child process: run the app and answer CPU time requests on ``control``"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "loadtest.db")}'
+    os.environ['BROADCAST_COALESCE_MS'] = str(coalesce_ms)
+    if workers > 1:
+        os.environ.setdefault('SOCKETIO_MESSAGE_QUEUE', f'sqlite:///{os.path.join(workdir, "bus.db")}')
+        os.environ.setdefault('PRESENCE_URL', f'sqlite:///{os.path.join(workdir, "presence.db")}')
+        os.environ.setdefault('OPLOG_URL', f'sqlite:///{os.path.join(workdir, "oplog.db")}')
+    # The handlers print every connect and disconnect, and the development
+    # server logs the close frame of every websocket as a bad request
+    sys.stdout = open(os.devnull, 'w')
+    logging.getLogger('werkzeug').setLevel(logging.CRITICAL)
+    from app import app, socketio
+    from database import db
+    # Workers start one after the other, so only the first creates the tables
+    with app.app_context():
+        db.create_all()
+    threading.Thread(target=socketio.run, args=(app,), kwargs={
+        'host': '127.0.0.1', 'port': port, 'debug': False, 'use_reloader': False,
+        'log_output': False, 'allow_unsafe_werkzeug': True
+    }, daemon=True).start()
+    control.send('ready')
+    while control.recv() == 'cpu':
+        control.send(time.process_time())
+
+def create_estimates(url, estimate_ids):
+    """Create the estimates of the rooms; the server only lets clients join existing ones"""
+    for estimate_id in estimate_ids:
+        request = urllib.request.Request(
+            f'{url}/api/estimates', method='POST', headers={'Content-Type': 'application/json'},
+            data=json.dumps({'id': estimate_id, 'project_name': estimate_id}).encode()
+        )
+        try:
+            urllib.request.urlopen(request, timeout=10).close()
+        except urllib.error.HTTPError as e:
+            if e.code != 400:  # 400: left over from an earlier run
+                raise
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f'server did not listen on port {port}')
+
+class Stats:
+    """Deliveries recorded by every client of the run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.received = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.joined = 0
+
+class LoadClient:
+    """One simulated editor connected to one estimate room"""
+
+    def __init__(self, index, room, stats):
+        import socketio
+        self.index = index
+        self.room = room
+        self.stats = stats
+        self.sio = socketio.Client(reconnection=False)
+        self.sent = 0
+        self._seen = set()  # (sender, seq)
+        self._last = {}  # sender -> highest seq received
+        self.sio.on('estimate_updated', self._on_update)
+        self.sio.on('estimate_updated_batch', self._on_batch)
+        self.sio.on('editor_joined', self._on_joined)
+
+    def connect(self, url):
+        self.sio.connect(url, transports=['websocket'], wait_timeout=10)
+
+    def join(self):
+        self.sio.emit('join_estimate', {'estimate_id': self.room})
+
+    def edit(self):
+        self.sio.emit('update_estimate', {
+            'estimate_id': self.room,
+            'type': 'task',
+            'action': 'update',
+            'data': {
+                'id': f'task-{self.index}',
+                'field': f'field-{self.sent}',
+                'value': 'x' * 32,
+                'sender': self.index,
+                'seq': self.sent,
+                'sent': time.perf_counter()
+            }
+        })
+        self.sent += 1
+
+    def disconnect(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+    def _on_joined(self, data):
+        with self.stats.lock:
+            self.stats.joined += 1
+
+    def _on_update(self, update):
+        self._record([update], time.perf_counter())
+
+    def _on_batch(self, batch):
+        self._record(batch.get('updates', []), time.perf_counter())
+
+    def _record(self, updates, now):
+        with self.stats.lock:
+            for update in updates:
+                data = update.get('data') or {}
+                key = (data.get('sender'), data.get('seq'))
+                if key[0] is None or key[0] == self.index:
+                    continue
+                if key in self._seen:
+                    self.stats.duplicates += 1
+                    continue
+                self._seen.add(key)
+                if key[1] < self._last.get(key[0], -1):
+                    self.stats.out_of_order += 1
+                self._last[key[0]] = max(key[1], self._last.get(key[0], -1))
+                self.stats.received += 1
+                self.stats.latencies.append((now - data['sent']) * 1000)
+
+def run_edits(editors, rate, duration, seed):
+    """Send edits from every editor as a Poisson process until ``duration`` elapses"""
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    queue = [(start + rng.expovariate(rate), i) for i in range(len(editors))]
+    heapq.heapify(queue)
+    while queue:
+        due, i = heapq.heappop(queue)
+        if due - start > duration:
+            continue
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        editors[i].edit()
+        heapq.heappush(queue, (due + rng.expovariate(rate), i))
+    return time.perf_counter() - start
+
+def run_load(args, urls, cpu_time=None):
+    """Connect the clients, run the edits and return the report"""
+    from instrumentation import percentile
+    stats = Stats()
+    room_ids = [f'loadtest-{r}' for r in range(args.rooms)]
+    clients = [LoadClient(i, room_ids[i % args.rooms], stats) for i in range(args.clients)]
+    create_estimates(urls[0], room_ids)
+
+    # Members of a room take turns between the workers
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.connect_concurrency) as pool:
+        list(pool.map(lambda client: client.connect(urls[client.index // args.rooms % len(urls)]),
+                      clients))
+    connect_time = time.perf_counter() - started
+    for client in clients:
+        client.join()
+
+    # Every member sees at least the ones joining after it, k(k - 1) / 2 per
+    # room of k; concurrent joins can make both sides see each other
+    sizes = [sum(1 for c in clients if c.room == room) for room in room_ids]
+    expected_joined = sum(k * (k - 1) // 2 for k in sizes)
+    deadline = time.monotonic() + args.drain
+    while stats.joined < expected_joined and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    editors = [c for c in clients if c.index // args.rooms < args.editors]
+    cpu_before = cpu_time() if cpu_time else None
+    elapsed = run_edits(editors, args.rate, args.duration, args.seed)
+    sent = sum(c.sent for c in editors)
+    by_room = {room: sum(c.sent for c in editors if c.room == room) for room in room_ids}
+    expected = sum(by_room[room] * (size - 1) for room, size in zip(room_ids, sizes))
+    deadline = time.monotonic() + args.drain
+    while stats.received < expected and time.monotonic() < deadline:
+        time.sleep(0.05)
+    cpu_after = cpu_time() if cpu_time else None
+
+    # Closing a websocket waits for the server's close, so all clients leave at once
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        list(pool.map(LoadClient.disconnect, clients))
+
+    latencies = sorted(stats.latencies)
+    report = {
+        'clients': args.clients,
+        'rooms': args.rooms,
+        'workers': len(urls),
+        'room_size': {'min': min(sizes), 'max': max(sizes)},
+        'editors': len(editors),
+        'target_rate': round(args.rate * len(editors), 2),
+        'coalesce_ms': args.coalesce_ms,
+        'connect_s': round(connect_time, 3),
+        'joined': {'expected_at_least': expected_joined, 'received': stats.joined},
+        'edits': {
+            'sent': sent,
+            'per_second': round(sent / elapsed, 2) if elapsed else 0,
+        },
+        'deliveries': {
+            'expected': expected,
+            'received': stats.received,
+            'dropped': max(expected - stats.received, 0),
+            'duplicates': stats.duplicates,
+            'out_of_order': stats.out_of_order
+        },
+        'latency_ms': {
+            **{f'p{p}': round(percentile(latencies, p), 3) if latencies else None
+               for p in (50, 90, 99, 99.9)},
+            'max': round(latencies[-1], 3) if latencies else None,
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else None
+        },
+        'server_cpu': None
+    }
+    if cpu_before is not None:
+        cpu = cpu_after - cpu_before
+        report['server_cpu'] = {
+            'seconds': round(cpu, 3),
+            'per_event_ms': round(cpu / sent * 1000, 4) if sent else None,
+            'per_delivery_us': round(cpu / stats.received * 1e6, 2) if stats.received else None,
+            'utilization': round(cpu / elapsed, 3) if elapsed else None
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=100, help='connected clients')
+    parser.add_argument('--rooms', type=int, default=10, help='estimate rooms, clients spread evenly')
+    parser.add_argument('--editors', type=int, default=2, help='clients sending edits per room')
+    parser.add_argument('--rate', type=float, default=2.0, help='edits per second per editor')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of edits')
+    parser.add_argument('--drain', type=float, default=5.0,
+                        help='seconds to wait for outstanding deliveries')
+    parser.add_argument('--coalesce-ms', type=int, default=0, help='BROADCAST_COALESCE_MS of the server')
+    parser.add_argument('--connect-concurrency', type=int, default=32,
+                        help='clients connecting at once')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the edit schedule')
+    parser.add_argument('--workers', type=int, default=1, help='server processes to start')
+    parser.add_argument('--url', action='append',
+                        help='target a running server instead of starting one (repeatable)')
+    parser.add_argument('--output', help='write the report to this file instead of stdout')
+    args = parser.parse_args()
+    if min(args.clients, args.rooms, args.connect_concurrency, args.workers) < 1 or args.rate <= 0 or args.editors < 0:
+        parser.error('--clients, --rooms, --rate, --workers and --connect-concurrency must be positive')
+    args.rooms = min(args.rooms, args.clients)
+
+    try:
+        import socketio
+        import websocket  # noqa: F401 (websocket transport of the client)
+    except ImportError:
+        sys.exit('loadtest.py needs the Socket.IO client: pip install requests websocket-client')
+
+    servers = []
+    cpu_time = None
+    urls = args.url
+    if not urls:
+        workdir = tempfile.mkdtemp(prefix='estimate-loadtest-')
+        urls = []
+        for _ in range(args.workers):
+            port = free_port()
+            control, child = multiprocessing.Pipe()
+            server = multiprocessing.Process(target=serve, daemon=True, args=(
+                port, workdir, args.coalesce_ms, args.workers, child
+            ))
+            server.start()
+            control.recv()
+            wait_for_port(port)
+            servers.append((server, control))
+            urls.append(f'http://127.0.0.1:{port}')
+
+        def cpu_time():
+            for _, control in servers:
+                control.send('cpu')
+            return sum(control.recv() for _, control in servers)
+
+    try:
+        report = run_load(args, urls, cpu_time)
+    finally:
+        for server, control in servers:
+            control.send('stop')
+            server.join(timeout=5)
+            if server.is_alive():
+                server.terminate()
+        if servers:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
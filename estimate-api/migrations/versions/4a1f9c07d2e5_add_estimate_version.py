@@ -0,0 +1,26 @@
+"""add estimate version
+
+Revision ID: 4a1f9c07d2e5
+Revises: b7c41e2d58a0
+Create Date: 2026-10-17 12:08:33.915204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a1f9c07d2e5'
+down_revision = 'b7c41e2d58a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('estimate', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('estimate', schema=None) as batch_op:
+        batch_op.drop_column('version')
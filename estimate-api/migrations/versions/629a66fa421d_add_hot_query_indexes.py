@@ -0,0 +1,62 @@
+"""add hot query indexes
+
+Revision ID: 629a66fa421d
+Revises: e3944d1adf37
+Create Date: 2026-10-17 09:20:05.771930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '629a66fa421d'
+down_revision = 'e3944d1adf37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('estimate', schema=None) as batch_op:
+        batch_op.create_index('ix_estimate_created_at_id', ['created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('epic', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_epic_estimate_id'), ['estimate_id'], unique=False)
+
+    with op.batch_alter_table('story', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_story_epic_id'), ['epic_id'], unique=False)
+
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_task_story_id'), ['story_id'], unique=False)
+
+    with op.batch_alter_table('subtask', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_subtask_task_id'), ['task_id'], unique=False)
+
+    with op.batch_alter_table('draft', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_draft_estimate_id'), ['estimate_id'], unique=False)
+
+    with op.batch_alter_table('personnel', schema=None) as batch_op:
+        batch_op.create_index('ix_personnel_entity', ['entity_type', 'entity_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('personnel', schema=None) as batch_op:
+        batch_op.drop_index('ix_personnel_entity')
+
+    with op.batch_alter_table('draft', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_draft_estimate_id'))
+
+    with op.batch_alter_table('subtask', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_subtask_task_id'))
+
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_task_story_id'))
+
+    with op.batch_alter_table('story', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_story_epic_id'))
+
+    with op.batch_alter_table('epic', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_epic_estimate_id'))
+
+    with op.batch_alter_table('estimate', schema=None) as batch_op:
+        batch_op.drop_index('ix_estimate_created_at_id')
@@ -0,0 +1,131 @@
+"""compress draft snapshots
+
+Revision ID: 9d785f6b16f3
+Revises: 629a66fa421d
+Create Date: 2026-10-17 10:02:17.480612
+
+Moves every draft's JSON into a zlib compressed draft_blob row addressed by
+the sha256 of its canonical form, so identical snapshots share one blob.
+
+"""
+import hashlib
+import json
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d785f6b16f3'
+down_revision = '629a66fa421d'
+branch_labels = None
+depends_on = None
+
+
+def canonical(data):
+    # Must match snapshots.canonical()
+    return json.dumps(data, sort_keys=True, indent=0, separators=(',', ':'))
+
+
+def upgrade():
+    op.create_table('draft_blob',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('encoding', sa.String(length=10), nullable=False),
+    sa.Column('base_hash', sa.String(length=64), nullable=True),
+    sa.Column('depth', sa.Integer(), nullable=True),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['base_hash'], ['draft_blob.hash'], ),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    with op.batch_alter_table('draft_blob', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_draft_blob_base_hash'), ['base_hash'], unique=False)
+
+    with op.batch_alter_table('draft', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('blob_hash', sa.String(length=64), nullable=True))
+        batch_op.alter_column('estimate_data',
+               existing_type=sa.Text(),
+               nullable=True)
+        batch_op.create_index(batch_op.f('ix_draft_blob_hash'), ['blob_hash'], unique=False)
+        batch_op.create_foreign_key('fk_draft_blob_hash_draft_blob', 'draft_blob', ['blob_hash'], ['hash'])
+
+    draft = sa.table('draft',
+        sa.column('id', sa.String),
+        sa.column('estimate_data', sa.Text),
+        sa.column('blob_hash', sa.String))
+    draft_blob = sa.table('draft_blob',
+        sa.column('hash', sa.String),
+        sa.column('encoding', sa.String),
+        sa.column('depth', sa.Integer),
+        sa.column('size', sa.Integer),
+        sa.column('data', sa.LargeBinary))
+
+    bind = op.get_bind()
+    stored = set()
+    rows = bind.execute(
+        sa.select(draft.c.id, draft.c.estimate_data).where(draft.c.estimate_data.isnot(None))
+    ).all()
+    for draft_id, estimate_data in rows:
+        text = canonical(json.loads(estimate_data)).encode('utf-8')
+        digest = hashlib.sha256(text).hexdigest()
+        if digest not in stored:
+            bind.execute(draft_blob.insert().values(
+                hash=digest, encoding='zlib', depth=0, size=len(text), data=zlib.compress(text, 6)
+            ))
+            stored.add(digest)
+        bind.execute(draft.update().where(draft.c.id == draft_id).values(
+            blob_hash=digest, estimate_data=None
+        ))
+
+
+def downgrade():
+    draft = sa.table('draft',
+        sa.column('id', sa.String),
+        sa.column('estimate_data', sa.Text),
+        sa.column('blob_hash', sa.String))
+    draft_blob = sa.table('draft_blob',
+        sa.column('hash', sa.String),
+        sa.column('encoding', sa.String),
+        sa.column('base_hash', sa.String),
+        sa.column('data', sa.LargeBinary))
+
+    bind = op.get_bind()
+    blobs = {row.hash: row for row in bind.execute(sa.select(draft_blob)).all()}
+
+    def text_of(blob_hash):
+        # Mirrors DraftBlob.get_text() for full and line-delta blobs
+        blob = blobs[blob_hash]
+        text = zlib.decompress(blob.data).decode('utf-8')
+        if blob.encoding != 'delta':
+            return text
+        base_lines = text_of(blob.base_hash).split('\n')
+        lines = []
+        for chunk in json.loads(text):
+            if chunk and isinstance(chunk[0], int):
+                lines.extend(base_lines[chunk[0]:chunk[1]])
+            else:
+                lines.extend(chunk)
+        return '\n'.join(lines)
+
+    rows = bind.execute(
+        sa.select(draft.c.id, draft.c.blob_hash).where(draft.c.blob_hash.isnot(None))
+    ).all()
+    for draft_id, blob_hash in rows:
+        estimate_data = json.dumps(json.loads(text_of(blob_hash)))
+        bind.execute(draft.update().where(draft.c.id == draft_id).values(
+            estimate_data=estimate_data, blob_hash=None
+        ))
+
+    with op.batch_alter_table('draft', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_draft_blob_hash_draft_blob', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_draft_blob_hash'))
+        batch_op.alter_column('estimate_data',
+               existing_type=sa.Text(),
+               nullable=False)
+        batch_op.drop_column('blob_hash')
+
+    with op.batch_alter_table('draft_blob', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_draft_blob_base_hash'))
+
+    op.drop_table('draft_blob')
@@ -0,0 +1,82 @@
+"""add personnel rollups
+
+Revision ID: b7c41e2d58a0
+Revises: 9d785f6b16f3
+Create Date: 2026-10-17 11:24:51.203377
+
+Adds the rollup table holding per-node and per-estimate personnel totals and
+fills it from the existing personnel rows.
+
+"""
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c41e2d58a0'
+down_revision = '9d785f6b16f3'
+branch_labels = None
+depends_on = None
+
+# Level -> (table, parent column, parent level)
+LEVELS = {
+    'epic': ('epic', 'estimate_id', 'estimate'),
+    'story': ('story', 'epic_id', 'epic'),
+    'task': ('task', 'story_id', 'story'),
+    'subtask': ('subtask', 'task_id', 'task'),
+}
+
+
+def upgrade():
+    rollup = op.create_table('rollup',
+    sa.Column('entity_type', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.String(length=36), nullable=False),
+    sa.Column('type', sa.String(length=50), nullable=False),
+    sa.Column('estimate_id', sa.String(length=36), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['estimate_id'], ['estimate.id'], ),
+    sa.PrimaryKeyConstraint('entity_type', 'entity_id', 'type')
+    )
+    with op.batch_alter_table('rollup', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_rollup_estimate_id'), ['estimate_id'], unique=False)
+
+    # Sum every personnel row into its node and each ancestor up to the estimate
+    bind = op.get_bind()
+    parents = {}
+    for level, (table, parent_column, parent_level) in LEVELS.items():
+        for node_id, parent_id in bind.execute(sa.text(f'SELECT id, {parent_column} FROM {table}')):
+            parents[(level, node_id)] = (parent_level, parent_id)
+
+    totals = defaultdict(float)
+    estimates = {}
+    personnel = bind.execute(sa.text('SELECT entity_type, entity_id, type, value FROM personnel'))
+    for entity_type, entity_id, personnel_type, value in personnel:
+        path = []
+        node = (entity_type, entity_id)
+        while node in parents:
+            path.append(node)
+            node = parents[node]
+        if node[0] != 'estimate':
+            # Orphaned row, not reachable from any estimate
+            continue
+        for entity in path + [node]:
+            totals[entity + (personnel_type,)] += value or 0
+            estimates[entity] = node[1]
+
+    rows = [
+        {'entity_type': entity_type, 'entity_id': entity_id, 'type': personnel_type,
+         'estimate_id': estimates[(entity_type, entity_id)], 'total': total}
+        for (entity_type, entity_id, personnel_type), total in totals.items()
+        if abs(total) > 1e-9
+    ]
+    if rows:
+        op.bulk_insert(rollup, rows)
+
+
+def downgrade():
+    with op.batch_alter_table('rollup', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_rollup_estimate_id'))
+
+    op.drop_table('rollup')
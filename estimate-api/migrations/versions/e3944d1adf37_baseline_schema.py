@@ -0,0 +1,104 @@
+"""baseline schema
+
+Revision ID: e3944d1adf37
+Revises: 
+Create Date: 2026-10-17 09:12:41.318204
+
+Databases created earlier with db.create_all() already contain these tables,
+so each one is only created when it is missing; upgrading such a database
+simply records this revision.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3944d1adf37'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'estimate' not in existing:
+        op.create_table('estimate',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('project_name', sa.String(length=200), nullable=False),
+        sa.Column('start_date', sa.Date(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('is_draft', sa.Boolean(), nullable=True),
+        sa.Column('active_editors', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'epic' not in existing:
+        op.create_table('epic',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('estimate_id', sa.String(length=36), nullable=False),
+        sa.ForeignKeyConstraint(['estimate_id'], ['estimate.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'draft' not in existing:
+        op.create_table('draft',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('estimate_id', sa.String(length=36), nullable=False),
+        sa.Column('estimate_data', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['estimate_id'], ['estimate.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'story' not in existing:
+        op.create_table('story',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('epic_id', sa.String(length=36), nullable=False),
+        sa.ForeignKeyConstraint(['epic_id'], ['epic.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'task' not in existing:
+        op.create_table('task',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('story_id', sa.String(length=36), nullable=False),
+        sa.ForeignKeyConstraint(['story_id'], ['story.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'subtask' not in existing:
+        op.create_table('subtask',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('task_id', sa.String(length=36), nullable=False),
+        sa.ForeignKeyConstraint(['task_id'], ['task.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'personnel' not in existing:
+        op.create_table('personnel',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('type', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.Float(), nullable=True),
+        sa.Column('entity_type', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.String(length=36), nullable=False),
+        sa.Column('epic_id', sa.String(length=36), nullable=True),
+        sa.Column('story_id', sa.String(length=36), nullable=True),
+        sa.Column('task_id', sa.String(length=36), nullable=True),
+        sa.Column('subtask_id', sa.String(length=36), nullable=True),
+        sa.ForeignKeyConstraint(['epic_id'], ['epic.id'], ),
+        sa.ForeignKeyConstraint(['story_id'], ['story.id'], ),
+        sa.ForeignKeyConstraint(['subtask_id'], ['subtask.id'], ),
+        sa.ForeignKeyConstraint(['task_id'], ['task.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('personnel')
+    op.drop_table('subtask')
+    op.drop_table('task')
+    op.drop_table('story')
+    op.drop_table('draft')
+    op.drop_table('epic')
+    op.drop_table('estimate')
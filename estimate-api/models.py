@@ -1,66 +1,72 @@
 # filepath: models.py
 from database import db
+from presence import presence
+from snapshots import canonical, content_hash, compress, decompress, line_delta, apply_delta
 import datetime
 import json
 import uuid
+from collections import defaultdict
+from sqlalchemy import union_all
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, foreign, remote
 
 class Estimate(db.Model):
+    __table_args__ = (
+        # Keyset pagination of the estimate listing
+        db.Index('ix_estimate_created_at_id', 'created_at', 'id'),
+    )
+
     id = db.Column(db.String(36), primary_key=True)
     project_name = db.Column(db.String(200), nullable=False)
     start_date = db.Column(db.Date, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     is_draft = db.Column(db.Boolean, default=True)
+    # Bumped by every write; exposed as the ETag of the estimate
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Relationships
     epics = db.relationship('Epic', backref='estimate', lazy=True, cascade='all, delete-orphan')
     
-    # Active editors tracking
-    active_editors = db.Column(db.Text, default='[]')  # JSON array of client IDs
+    # Legacy JSON array of client IDs; live presence is kept in presence.py
+    active_editors = db.Column(db.Text, default='[]')
     
     def __init__(self, project_name, start_date, is_draft=True, id=None):
         self.id = id or str(uuid.uuid4())
         self.project_name = project_name
         self.start_date = start_date
         self.is_draft = is_draft
+        self.version = 1
         self.active_editors = '[]'
     
     def add_active_editor(self, client_id):
-        editors = json.loads(self.active_editors)
-        if client_id not in editors:
-            editors.append(client_id)
-            self.active_editors = json.dumps(editors)
-            return True
-        return False
+        return presence.join(self.id, client_id)
     
     def remove_active_editor(self, client_id):
-        editors = json.loads(self.active_editors)
-        if client_id in editors:
-            editors.remove(client_id)
-            self.active_editors = json.dumps(editors)
-            return True
-        return False
+        return presence.leave(self.id, client_id)
     
     def get_active_editors(self):
-        return json.loads(self.active_editors)
+        return presence.editors(self.id)
     
     def to_dict(self):
+        # Rollups of the whole tree are read once and handed down
+        totals = Rollup.totals_by_node(self.id)
         return {
             'id': self.id,
             'project_name': self.project_name,
             'start_date': self.start_date.isoformat(),
             'created_at': self.created_at.isoformat(),
             'is_draft': self.is_draft,
-            'epics': [epic.to_dict() for epic in self.epics],
-            'active_editors': self.get_active_editors()
+            'version': self.version,
+            'epics': [epic.to_dict(totals) for epic in self.epics],
+            'active_editors': self.get_active_editors(),
+            'totals': totals.get(('estimate', self.id), {})
         }
 
 # Modify the Epic model to correctly define the relationship with Personnel
 class Epic(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    estimate_id = db.Column(db.String(36), db.ForeignKey('estimate.id'), nullable=False)
+    estimate_id = db.Column(db.String(36), db.ForeignKey('estimate.id'), nullable=False, index=True)
     
     # Relationships
     stories = db.relationship('Story', backref='epic', lazy=True, cascade='all, delete-orphan')
@@ -76,18 +82,21 @@ class Epic(db.Model):
         self.name = name
         self.estimate_id = estimate_id
     
-    def to_dict(self):
+    def to_dict(self, totals=None):
+        if totals is None:
+            totals = Rollup.totals_by_node(self.estimate_id)
         return {
             'id': self.id,
             'name': self.name,
-            'stories': [story.to_dict() for story in self.stories],
-            'personnel': [p.to_dict() for p in self.personnel]
+            'stories': [story.to_dict(totals) for story in self.stories],
+            'personnel': [p.to_dict() for p in self.personnel],
+            'totals': totals.get(('epic', self.id), {})
         }
 
 class Story(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    epic_id = db.Column(db.String(36), db.ForeignKey('epic.id'), nullable=False)
+    epic_id = db.Column(db.String(36), db.ForeignKey('epic.id'), nullable=False, index=True)
     
     # Relationships
     tasks = db.relationship('Task', backref='story', lazy=True, cascade='all, delete-orphan')
@@ -103,18 +112,21 @@ class Story(db.Model):
         self.name = name
         self.epic_id = epic_id
     
-    def to_dict(self):
+    def to_dict(self, totals=None):
+        if totals is None:
+            totals = Rollup.totals_by_node(self.epic.estimate_id)
         return {
             'id': self.id,
             'name': self.name,
-            'tasks': [task.to_dict() for task in self.tasks],
-            'personnel': [p.to_dict() for p in self.personnel]
+            'tasks': [task.to_dict(totals) for task in self.tasks],
+            'personnel': [p.to_dict() for p in self.personnel],
+            'totals': totals.get(('story', self.id), {})
         }
 
 class Task(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    story_id = db.Column(db.String(36), db.ForeignKey('story.id'), nullable=False)
+    story_id = db.Column(db.String(36), db.ForeignKey('story.id'), nullable=False, index=True)
     
     # Relationships
     subTasks = db.relationship('Subtask', backref='task', lazy=True, cascade='all, delete-orphan')
@@ -130,18 +142,21 @@ class Task(db.Model):
         self.name = name
         self.story_id = story_id
     
-    def to_dict(self):
+    def to_dict(self, totals=None):
+        if totals is None:
+            totals = Rollup.totals_by_node(self.story.epic.estimate_id)
         return {
             'id': self.id,
             'name': self.name,
-            'subTasks': [subtask.to_dict() for subtask in self.subTasks],
-            'personnel': [p.to_dict() for p in self.personnel]
+            'subTasks': [subtask.to_dict(totals) for subtask in self.subTasks],
+            'personnel': [p.to_dict() for p in self.personnel],
+            'totals': totals.get(('task', self.id), {})
         }
 
 class Subtask(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    task_id = db.Column(db.String(36), db.ForeignKey('task.id'), nullable=False)
+    task_id = db.Column(db.String(36), db.ForeignKey('task.id'), nullable=False, index=True)
     
     # Relationships
     personnel = db.relationship(
@@ -156,14 +171,22 @@ class Subtask(db.Model):
         self.name = name
         self.task_id = task_id
     
-    def to_dict(self):
+    def to_dict(self, totals=None):
+        if totals is None:
+            totals = Rollup.totals_by_node(self.task.story.epic.estimate_id)
         return {
             'id': self.id,
             'name': self.name,
-            'personnel': [p.to_dict() for p in self.personnel]
+            'personnel': [p.to_dict() for p in self.personnel],
+            'totals': totals.get(('subtask', self.id), {})
         }
 
 class Personnel(db.Model):
+    __table_args__ = (
+        # Every personnel relationship and lookup filters on this pair
+        db.Index('ix_personnel_entity', 'entity_type', 'entity_id'),
+    )
+
     id = db.Column(db.String(36), primary_key=True)
     type = db.Column(db.String(50), nullable=False)  # DEV, BA, TESTER
     value = db.Column(db.Float, default=0)
@@ -200,18 +223,139 @@ class Personnel(db.Model):
             'value': self.value
         }
 
+class Rollup(db.Model):
+    """Personnel effort of one type summed over a node's subtree, or a whole estimate"""
+    entity_type = db.Column(db.String(20), primary_key=True)  # 'estimate', 'epic', 'story', 'task', 'subtask'
+    entity_id = db.Column(db.String(36), primary_key=True)
+    type = db.Column(db.String(50), primary_key=True)  # DEV, BA, TESTER
+    estimate_id = db.Column(db.String(36), db.ForeignKey('estimate.id'), nullable=False, index=True)
+    total = db.Column(db.Float, nullable=False, default=0)
+    
+    def __init__(self, entity_type, entity_id, type, estimate_id, total=0):
+        self.entity_type = entity_type
+        self.entity_id = entity_id
+        self.type = type
+        self.estimate_id = estimate_id
+        self.total = total
+    
+    @classmethod
+    def totals_for(cls, entity_type, entity_id):
+        rows = db.session.execute(
+            db.select(cls.type, cls.total).where(cls.entity_type == entity_type, cls.entity_id == entity_id)
+        ).all()
+        return {row.type: row.total for row in rows}
+    
+    @classmethod
+    def totals_by_node(cls, estimate_id):
+        """Totals of an estimate and all of its nodes, keyed by (entity_type, entity_id)"""
+        totals = defaultdict(dict)
+        rows = db.session.execute(
+            db.select(cls.entity_type, cls.entity_id, cls.type, cls.total)
+            .where(cls.estimate_id == estimate_id)
+        ).all()
+        for row in rows:
+            totals[(row.entity_type, row.entity_id)][row.type] = row.total
+        return totals
+
+class DraftBlob(db.Model):
+    """Compressed estimate snapshot, shared by every draft with the same content"""
+    hash = db.Column(db.String(64), primary_key=True)  # sha256 of the canonical JSON
+    encoding = db.Column(db.String(10), nullable=False)  # 'zlib' or 'delta'
+    base_hash = db.Column(db.String(64), db.ForeignKey('draft_blob.hash'), nullable=True, index=True)
+    depth = db.Column(db.Integer, default=0)  # length of the delta chain below this blob
+    size = db.Column(db.Integer, nullable=False)  # bytes of the decoded JSON
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False))
+
+    def __init__(self, hash, encoding, data, size, base_hash=None, depth=0):
+        self.hash = hash
+        self.encoding = encoding
+        self.data = data
+        self.size = size
+        self.base_hash = base_hash
+        self.depth = depth
+
+    def get_text(self):
+        """Canonical JSON text of the snapshot"""
+        if self.encoding == 'delta':
+            base = db.session.get(DraftBlob, self.base_hash)
+            return apply_delta(base.get_text(), json.loads(decompress(self.data)))
+        return decompress(self.data)
+
+    @classmethod
+    def store(cls, estimate_data, base=None, max_depth=0):
+        """Return the blob holding a snapshot, adding one unless the content exists.
+
+        When ``base`` is given and its delta chain is shorter than
+        ``max_depth``, the snapshot is stored as a line delta against it if
+        that is smaller than compressing it whole.
+        """
+        text = canonical(estimate_data)
+        digest = content_hash(text)
+        blob = db.session.get(cls, digest)
+        if blob is not None:
+            return blob
+
+        blob = cls(hash=digest, encoding='zlib', data=compress(text), size=len(text.encode('utf-8')))
+        if base is not None and base.depth < max_depth:
+            delta = compress(json.dumps(line_delta(base.get_text(), text), separators=(',', ':')))
+            if len(delta) < len(blob.data):
+                blob.encoding = 'delta'
+                blob.data = delta
+                blob.base_hash = base.hash
+                blob.depth = base.depth + 1
+        db.session.add(blob)
+        return blob
+
+    @classmethod
+    def release(cls, blob_hash):
+        """Delete a blob no draft or delta refers to any more, then try its base"""
+        while blob_hash is not None:
+            referenced = db.session.execute(
+                db.select(Draft.id).where(Draft.blob_hash == blob_hash).limit(1)
+            ).first() or db.session.execute(
+                db.select(cls.hash).where(cls.base_hash == blob_hash).limit(1)
+            ).first()
+            blob = db.session.get(cls, blob_hash)
+            if referenced or blob is None:
+                return
+            blob_hash = blob.base_hash
+            db.session.delete(blob)
+            db.session.flush()
+
 class Draft(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    estimate_id = db.Column(db.String(36), db.ForeignKey('estimate.id'), nullable=False)
-    estimate_data = db.Column(db.Text, nullable=False)  # JSON data of the estimate
+    estimate_id = db.Column(db.String(36), db.ForeignKey('estimate.id'), nullable=False, index=True)
+    estimate_data = db.deferred(db.Column(db.Text, nullable=True))  # Legacy uncompressed JSON, superseded by blob
+    blob_hash = db.Column(db.String(64), db.ForeignKey('draft_blob.hash'), nullable=True, index=True)
+    
+    blob = db.relationship('DraftBlob', lazy=True)
     
-    def __init__(self, name, estimate_id, estimate_data, id=None):
+    def __init__(self, name, estimate_id, estimate_data=None, id=None, blob=None):
         self.id = id or str(uuid.uuid4())
         self.name = name
         self.estimate_id = estimate_id
-        self.estimate_data = json.dumps(estimate_data)
+        if blob is None:
+            blob = DraftBlob.store(estimate_data)
+        self.blob = blob
+        self.blob_hash = blob.hash
+    
+    def get_estimate_data(self):
+        if self.blob_hash is None:
+            return json.loads(self.estimate_data)
+        return json.loads(self.blob.get_text())
+    
+    @staticmethod
+    def summary_dict(row):
+        """Listing entry for a row of draft metadata, without the snapshot"""
+        return {
+            'id': row.id,
+            'name': row.name,
+            'timestamp': row.timestamp.isoformat(),
+            'estimate_id': row.estimate_id,
+            'size': row.size
+        }
     
     def to_dict(self):
         return {
@@ -219,5 +363,185 @@ class Draft(db.Model):
             'name': self.name,
             'timestamp': self.timestamp.isoformat(),
             'estimate_id': self.estimate_id,
-            'estimate': json.loads(self.estimate_data)
-        }
\ No newline at end of file
+            'estimate': self.get_estimate_data()
+        }
+
+def join_to_epic(query, model):
+    """Join ``query`` from ``model`` up the hierarchy to ``Epic``.
+
+    Lets any level be filtered by ``Epic.estimate_id`` without loading the
+    intermediate nodes.
+    """
+    if model is Subtask:
+        query = query.join(Task, Subtask.task_id == Task.id)
+        model = Task
+    if model is Task:
+        query = query.join(Story, Task.story_id == Story.id)
+        model = Story
+    if model is Story:
+        query = query.join(Epic, Story.epic_id == Epic.id)
+    return query
+
+NODE_MODELS = {
+    'epic': Epic,
+    'story': Story,
+    'task': Task,
+    'subtask': Subtask
+}
+
+def personnel_union(columns, condition):
+    """Select personnel of every hierarchy level in one statement.
+
+    Each branch restricts personnel to the (entity_type, entity_id) pairs of
+    the nodes of one level matching ``condition``, which may refer to any
+    level up to ``Epic``. The id lists are subqueries so the lookup is driven
+    by the composite personnel index.
+    """
+    return union_all(*[
+        db.select(*columns).where(
+            Personnel.entity_type == entity_type,
+            Personnel.entity_id.in_(join_to_epic(db.select(model.id), model).where(condition))
+        )
+        for entity_type, model in NODE_MODELS.items()
+    ])
+
+def _personnel_dicts(rows):
+    """Group personnel rows by the (entity_type, entity_id) they belong to"""
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[(row.entity_type, row.entity_id)].append({
+            'id': row.id,
+            'type': row.type,
+            'value': row.value
+        })
+    return grouped
+
+def load_estimate_tree(estimate_id):
+    """Serialize an estimate and its whole hierarchy in a constant number of queries.
+
+    Produces the same structure as ``Estimate.to_dict()`` but reads plain rows
+    for each level plus all personnel up front instead of walking the lazy
+    relationships node by node. Returns None if the estimate does not exist.
+    """
+    estimate = db.session.execute(
+        db.select(
+            Estimate.id, Estimate.project_name, Estimate.start_date,
+            Estimate.created_at, Estimate.is_draft, Estimate.version
+        ).where(Estimate.id == estimate_id)
+    ).first()
+    if estimate is None:
+        return None
+
+    epic_rows = db.session.execute(
+        db.select(Epic.id, Epic.name).where(Epic.estimate_id == estimate_id)
+    ).all()
+    story_rows = db.session.execute(join_to_epic(
+        db.select(Story.id, Story.name, Story.epic_id), Story
+    ).where(Epic.estimate_id == estimate_id)).all()
+    task_rows = db.session.execute(join_to_epic(
+        db.select(Task.id, Task.name, Task.story_id), Task
+    ).where(Epic.estimate_id == estimate_id)).all()
+    subtask_rows = db.session.execute(join_to_epic(
+        db.select(Subtask.id, Subtask.name, Subtask.task_id), Subtask
+    ).where(Epic.estimate_id == estimate_id)).all()
+
+    personnel_rows = db.session.execute(personnel_union(
+        (Personnel.id, Personnel.type, Personnel.value,
+         Personnel.entity_type, Personnel.entity_id),
+        Epic.estimate_id == estimate_id
+    )).all()
+    personnel = _personnel_dicts(personnel_rows)
+
+    totals = Rollup.totals_by_node(estimate_id)
+
+    # Build the tree bottom-up so every parent can pick up its children by id
+    subtasks_by_task = defaultdict(list)
+    for row in subtask_rows:
+        subtasks_by_task[row.task_id].append({
+            'id': row.id,
+            'name': row.name,
+            'personnel': personnel[('subtask', row.id)],
+            'totals': totals[('subtask', row.id)]
+        })
+
+    tasks_by_story = defaultdict(list)
+    for row in task_rows:
+        tasks_by_story[row.story_id].append({
+            'id': row.id,
+            'name': row.name,
+            'subTasks': subtasks_by_task[row.id],
+            'personnel': personnel[('task', row.id)],
+            'totals': totals[('task', row.id)]
+        })
+
+    stories_by_epic = defaultdict(list)
+    for row in story_rows:
+        stories_by_epic[row.epic_id].append({
+            'id': row.id,
+            'name': row.name,
+            'tasks': tasks_by_story[row.id],
+            'personnel': personnel[('story', row.id)],
+            'totals': totals[('story', row.id)]
+        })
+
+    return {
+        'id': estimate.id,
+        'project_name': estimate.project_name,
+        'start_date': estimate.start_date.isoformat(),
+        'created_at': estimate.created_at.isoformat(),
+        'is_draft': estimate.is_draft,
+        'version': estimate.version,
+        'epics': [{
+            'id': row.id,
+            'name': row.name,
+            'stories': stories_by_epic[row.id],
+            'personnel': personnel[('epic', row.id)],
+            'totals': totals[('epic', row.id)]
+        } for row in epic_rows],
+        'active_editors': presence.editors(estimate.id),
+        'totals': totals[('estimate', estimate.id)]
+    }
+
+def summarize_estimates(estimates):
+    """Build summary dicts for a page of estimate rows without loading their trees.
+
+    ``estimates`` are rows carrying the scalar ``Estimate`` columns. Node
+    counts are aggregated in the database with one grouped statement per
+    level and per-role totals come from the estimate rollups, so the cost
+    does not depend on how large the individual trees are.
+    """
+    estimate_ids = [row.id for row in estimates]
+    if not estimate_ids:
+        return []
+
+    counts = defaultdict(dict)
+    for entity_type, model in NODE_MODELS.items():
+        rows = db.session.execute(
+            join_to_epic(db.select(Epic.estimate_id, db.func.count(model.id)), model)
+            .where(Epic.estimate_id.in_(estimate_ids))
+            .group_by(Epic.estimate_id)
+        ).all()
+        for estimate_id, count in rows:
+            counts[estimate_id][f'{entity_type}_count'] = count
+
+    totals = defaultdict(dict)
+    rows = db.session.execute(
+        db.select(Rollup.entity_id, Rollup.type, Rollup.total)
+        .where(Rollup.entity_type == 'estimate', Rollup.entity_id.in_(estimate_ids))
+    ).all()
+    for estimate_id, personnel_type, total in rows:
+        totals[estimate_id][personnel_type] = total
+
+    return [{
+        'id': row.id,
+        'project_name': row.project_name,
+        'start_date': row.start_date.isoformat(),
+        'created_at': row.created_at.isoformat(),
+        'is_draft': row.is_draft,
+        'version': row.version,
+        'epic_count': counts[row.id].get('epic_count', 0),
+        'story_count': counts[row.id].get('story_count', 0),
+        'task_count': counts[row.id].get('task_count', 0),
+        'subtask_count': counts[row.id].get('subtask_count', 0),
+        'totals': totals[row.id]
+    } for row in estimates]
@@ -0,0 +1,250 @@
+# filepath: operations.py
+"""Granular estimate edits expressed as {type, action, data} operations.
+
+These are the same operations the Socket.IO protocol broadcasts through
+``update_estimate``. Each one is applied directly to the rows it affects
+instead of re-saving the whole tree.
+
+    type      action               data
+    epic      add                  node payload (id, name, personnel, stories)
+    story     add                  node payload plus epic_id
+    task      add                  node payload plus story_id
+    subtask   add                  node payload plus task_id
+    <node>    update               id plus name
+    <node>    delete               id
+    personnel add                  entity_type, entity_id, type, value
+    personnel update               id plus type and/or value
+    personnel delete               id
+    project_name / start_date update  value
+"""
+import math
+from datetime import datetime
+from models import db, Estimate, Epic, Personnel, Rollup, NODE_MODELS, join_to_epic
+from save_engine import LEVELS, flatten_nodes, insert_rows, delete_subtrees, personnel_row
+from rollups import node_path, path_deltas, apply_rollup_deltas
+
+PARENT_TYPES = {
+    'epic': 'estimate',
+    'story': 'epic',
+    'task': 'story',
+    'subtask': 'task'
+}
+
+class OperationError(ValueError):
+    """Raised when an operation is malformed or targets rows outside the estimate"""
+
+    def __init__(self, index, message):
+        super().__init__(f'Operation {index}: {message}')
+        self.index = index
+
+def _require(data, key, index):
+    """Return ``data[key]``, raising OperationError if it is missing or empty"""
+    if key not in data or data[key] in (None, ''):
+        raise OperationError(index, f"missing '{key}'")
+    return data[key]
+
+def _check_value(value, index):
+    """Return a personnel value, raising OperationError unless it is a finite number"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise OperationError(index, f'invalid personnel value {value!r}')
+    return value
+
+def _check_type(personnel_type, index):
+    """Return a personnel type, raising OperationError unless it is a non-empty string"""
+    if not isinstance(personnel_type, str) or not personnel_type:
+        raise OperationError(index, f'invalid personnel type {personnel_type!r}')
+    return personnel_type
+
+def _check_name(name, index, field='name'):
+    """Return a node or project name, raising OperationError unless it is a string"""
+    if not isinstance(name, str):
+        raise OperationError(index, f'invalid {field} {name!r}')
+    return name
+
+def _check_nodes(index, level, items):
+    """Validate the nested nodes and personnel of an ``add`` payload before it is flattened"""
+    if not isinstance(items, list):
+        raise OperationError(index, f'expected a list of {level} nodes')
+    _, children_key, child_level = LEVELS[level]
+    for item in items:
+        if not isinstance(item, dict):
+            raise OperationError(index, f'expected a {level} object')
+        if 'name' in item:
+            _check_name(item['name'], index)
+        personnel = item.get('personnel', [])
+        if not isinstance(personnel, list):
+            raise OperationError(index, "expected a list of 'personnel'")
+        for personnel_data in personnel:
+            if not isinstance(personnel_data, dict):
+                raise OperationError(index, 'expected a personnel object')
+            _check_type(personnel_data.get('type'), index)
+            if 'value' in personnel_data:
+                _check_value(personnel_data['value'], index)
+        if children_key:
+            _check_nodes(index, child_level, item.get(children_key, []))
+
+def _owns(estimate_id, entity_type, node_id):
+    """Whether a node of ``entity_type`` belongs to the estimate"""
+    if entity_type == 'estimate':
+        return node_id == estimate_id
+    model = NODE_MODELS[entity_type]
+    return db.session.execute(
+        join_to_epic(db.select(model.id), model)
+        .where(model.id == node_id, Epic.estimate_id == estimate_id)
+    ).first() is not None
+
+def _parent_path(estimate_id, parent_type, parent_id):
+    """Rollup path above a new child of ``parent_id``"""
+    if parent_type == 'estimate':
+        return [('estimate', estimate_id)]
+    return node_path(parent_type, parent_id)
+
+def _added_deltas(rows, node_type, parent_path):
+    """Rollup deltas for a freshly inserted subtree of flattened rows"""
+    parents = {}
+    for level, (_, _, child_level) in LEVELS.items():
+        # The new root's own parent is covered by ``parent_path``
+        if child_level and child_level != node_type:
+            for row in rows.get(child_level, ()):
+                parents[(child_level, row['id'])] = (level, row[LEVELS[child_level][0]])
+    deltas = None
+    for row in rows.get('personnel', ()):
+        path = []
+        node = (row['entity_type'], row['entity_id'])
+        while node is not None:
+            path.append(node)
+            node = parents.get(node)
+        deltas = path_deltas(path + parent_path, row['type'], row['value'] or 0, deltas)
+    return deltas or {}
+
+def _apply_node(estimate_id, index, node_type, action, data):
+    model = NODE_MODELS[node_type]
+    if action == 'add':
+        parent_type = PARENT_TYPES[node_type]
+        parent_id = estimate_id if node_type == 'epic' else _require(data, LEVELS[node_type][0], index)
+        if not _owns(estimate_id, parent_type, parent_id):
+            raise OperationError(index, f'{parent_type} {parent_id} not found')
+        _check_nodes(index, node_type, [data])
+        rows = flatten_nodes(node_type, parent_id, [data])
+        insert_rows(rows)
+        apply_rollup_deltas(estimate_id, _added_deltas(
+            rows, node_type, _parent_path(estimate_id, parent_type, parent_id)
+        ))
+        return rows[node_type][0]['id']
+
+    node_id = _require(data, 'id', index)
+    if not _owns(estimate_id, node_type, node_id):
+        raise OperationError(index, f'{node_type} {node_id} not found')
+    if action == 'update':
+        if 'name' in data:
+            db.session.execute(
+                db.update(model).where(model.id == node_id).values(name=_check_name(data['name'], index)),
+                execution_options={'synchronize_session': False}
+            )
+    else:
+        # Take the subtree's totals off its ancestors before its rollups go
+        deltas = None
+        ancestors = node_path(node_type, node_id)[1:]
+        for personnel_type, total in Rollup.totals_for(node_type, node_id).items():
+            deltas = path_deltas(ancestors, personnel_type, -total, deltas)
+        delete_subtrees(node_type, db.select(model.id).where(model.id == node_id))
+        apply_rollup_deltas(estimate_id, deltas or {})
+    return node_id
+
+def _apply_personnel(estimate_id, index, action, data):
+    if action == 'add':
+        entity_type = _require(data, 'entity_type', index)
+        entity_id = _require(data, 'entity_id', index)
+        _check_type(_require(data, 'type', index), index)
+        if 'value' in data:
+            _check_value(data['value'], index)
+        if not isinstance(entity_type, str) or entity_type not in NODE_MODELS:
+            raise OperationError(index, f'invalid entity_type {entity_type!r}')
+        if not _owns(estimate_id, entity_type, entity_id):
+            raise OperationError(index, f'{entity_type} {entity_id} not found')
+        row = personnel_row(entity_type, entity_id, data)
+        if data.get('id'):
+            row['id'] = data['id']
+        db.session.execute(db.insert(Personnel), [row])
+        apply_rollup_deltas(estimate_id, path_deltas(
+            node_path(entity_type, entity_id), row['type'], row['value'] or 0
+        ))
+        return row['id']
+
+    personnel_id = _require(data, 'id', index)
+    owner = db.session.execute(
+        db.select(Personnel.entity_type, Personnel.entity_id, Personnel.type, Personnel.value)
+        .where(Personnel.id == personnel_id)
+    ).first()
+    if owner is None or not _owns(estimate_id, owner.entity_type, owner.entity_id):
+        raise OperationError(index, f'personnel {personnel_id} not found')
+
+    if action == 'delete':
+        statement = db.delete(Personnel)
+    else:
+        values = {key: data[key] for key in ('type', 'value') if key in data}
+        if 'type' in values:
+            _check_type(values['type'], index)
+        if 'value' in values:
+            _check_value(values['value'], index)
+        if not values:
+            return personnel_id
+        statement = db.update(Personnel).values(values)
+    db.session.execute(
+        statement.where(Personnel.id == personnel_id),
+        execution_options={'synchronize_session': False}
+    )
+
+    path = node_path(owner.entity_type, owner.entity_id)
+    deltas = path_deltas(path, owner.type, -(owner.value or 0))
+    if action == 'update':
+        path_deltas(path, values.get('type', owner.type), values.get('value', owner.value) or 0, deltas)
+    apply_rollup_deltas(estimate_id, deltas)
+    return personnel_id
+
+def _apply_field(estimate_id, index, field, data):
+    value = _require(data, 'value', index)
+    if field == 'start_date':
+        try:
+            value = datetime.fromisoformat(value).date()
+        except (TypeError, ValueError):
+            raise OperationError(index, f'invalid start_date {value!r}')
+    else:
+        _check_name(value, index, field)
+    db.session.execute(
+        db.update(Estimate).where(Estimate.id == estimate_id).values({field: value}),
+        execution_options={'synchronize_session': False}
+    )
+    return estimate_id
+
+def apply_operations(estimate_id, operations):
+    """Apply a list of operations to an estimate in order.
+
+    Returns one result per operation with the id of the row it touched
+    (the new id for adds). Raises OperationError on the first invalid
+    operation; the caller is expected to roll back. Does not commit.
+    """
+    if not isinstance(operations, list):
+        raise OperationError(0, 'expected a list of operations')
+
+    results = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise OperationError(index, 'expected an object')
+        op_type = operation.get('type')
+        action = operation.get('action')
+        data = operation.get('data')
+        if not isinstance(data, dict):
+            raise OperationError(index, "missing 'data'")
+
+        if op_type in NODE_MODELS and action in ('add', 'update', 'delete'):
+            row_id = _apply_node(estimate_id, index, op_type, action, data)
+        elif op_type == 'personnel' and action in ('add', 'update', 'delete'):
+            row_id = _apply_personnel(estimate_id, index, action, data)
+        elif op_type in ('project_name', 'start_date') and action == 'update':
+            row_id = _apply_field(estimate_id, index, op_type, data)
+        else:
+            raise OperationError(index, f'unsupported operation {op_type}/{action}')
+
+        results.append({'type': op_type, 'action': action, 'id': row_id})
+    return results
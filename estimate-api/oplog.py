@@ -0,0 +1,144 @@
+# filepath: oplog.py
+"""Bounded log of the real-time operations applied to each estimate.
+
+Every update accepted by ``update_estimate`` is stamped with the next
+sequence number of its estimate and appended here; only the last
+``OPLOG_SIZE`` operations of an estimate are kept. A client rejoining with
+the last sequence it saw gets the operations it missed, or ``None`` when
+they are no longer retained (or the log restarted behind it), in which
+case it needs a fresh snapshot.
+
+Backends are chosen with ``OPLOG_URL``:
+
+    memory://               per-process log (default)
+    sqlite:///<path>        log in a SQLite file shared by the workers of a host
+
+Use the SQLite log with a shared message bus so sequence numbers stay
+consistent across workers.
+"""
+import json
+import sqlite3
+import threading
+from collections import deque
+from itertools import islice
+
+class MemoryLog:
+    """Per-process operation log"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._logs = {}  # estimate id -> [head sequence, deque of (seq, operation)]
+
+    def append(self, estimate_id, operation):
+        with self._lock:
+            log = self._logs.setdefault(estimate_id, [0, deque(maxlen=self.capacity)])
+            log[0] += 1
+            operation = dict(operation, seq=log[0])
+            log[1].append((log[0], operation))
+            return operation
+
+    def head(self, estimate_id):
+        with self._lock:
+            log = self._logs.get(estimate_id)
+            return log[0] if log else 0
+
+    def since(self, estimate_id, seq):
+        with self._lock:
+            head, entries = self._logs.get(estimate_id, (0, ()))
+            oldest = entries[0][0] if entries else head + 1
+            if seq > head or seq < oldest - 1:
+                return None
+            # Sequence numbers in the deque are consecutive
+            return [operation for _, operation in islice(entries, seq - oldest + 1, None)]
+
+class SQLiteLog:
+    """Operation log kept in a SQLite file so every worker process on a host shares it"""
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self._local = threading.local()
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS operation_log ('
+            'estimate_id TEXT, seq INTEGER, operation TEXT, PRIMARY KEY (estimate_id, seq))'
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _bounds(self, conn, estimate_id):
+        return conn.execute(
+            'SELECT COALESCE(MIN(seq), 0), COALESCE(MAX(seq), 0) FROM operation_log WHERE estimate_id = ?',
+            (estimate_id,)
+        ).fetchone()
+
+    def append(self, estimate_id, operation):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            seq = self._bounds(conn, estimate_id)[1] + 1
+            operation = dict(operation, seq=seq)
+            conn.execute('INSERT INTO operation_log VALUES (?, ?, ?)',
+                         (estimate_id, seq, json.dumps(operation, separators=(',', ':'))))
+            conn.execute('DELETE FROM operation_log WHERE estimate_id = ? AND seq <= ?',
+                         (estimate_id, seq - self.capacity))
+            conn.execute('COMMIT')
+            return operation
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def head(self, estimate_id):
+        return self._bounds(self._connect(), estimate_id)[1]
+
+    def since(self, estimate_id, seq):
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            oldest, head = self._bounds(conn, estimate_id)
+            if seq > head or seq < oldest - 1:
+                return None
+            return [json.loads(row[0]) for row in conn.execute(
+                'SELECT operation FROM operation_log WHERE estimate_id = ? AND seq > ? ORDER BY seq',
+                (estimate_id, seq)
+            ).fetchall()]
+        finally:
+            conn.execute('COMMIT')
+
+def make_log(url, capacity):
+    """Build the log named by an OPLOG_URL"""
+    if url in ('', 'memory://'):
+        return MemoryLog(capacity)
+    if url.startswith('sqlite:///'):
+        return SQLiteLog(url[len('sqlite:///'):], capacity)
+    raise ValueError(f'Unsupported OPLOG_URL: {url}')
+
+class OperationLog:
+    """Sequenced operations of each estimate"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryLog(1000)
+
+    def init_app(self, app):
+        self.backend = make_log(app.config['OPLOG_URL'], app.config['OPLOG_SIZE'])
+
+    def append(self, estimate_id, operation):
+        """Stamp an operation with the next sequence number of its estimate, log and return it"""
+        return self.backend.append(estimate_id, operation)
+
+    def head(self, estimate_id):
+        """Sequence number of the last operation of an estimate, 0 if none"""
+        return self.backend.head(estimate_id)
+
+    def since(self, estimate_id, seq):
+        """Operations after ``seq`` in order, or None if some are no longer retained"""
+        return self.backend.since(estimate_id, seq)
+
+# Shared by the Socket.IO handlers of this process
+operation_log = OperationLog()
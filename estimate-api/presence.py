@@ -0,0 +1,241 @@
+# filepath: presence.py
+"""In-memory registry of the clients editing each estimate.
+
+Presence is indexed both by estimate and by socket sid, so listing the
+editors of an estimate and cleaning up after a disconnect only touch the
+rooms involved. Every sid carries a last-seen time refreshed by its events
+and heartbeats; sids that go quiet for longer than the configured timeout
+are expired by a periodic sweep.
+
+``PRESENCE_URL`` picks where presence lives: ``memory://`` (default) keeps it
+in this process, ``sqlite:///<path>`` shares it between the workers of a
+host, for use with a Socket.IO message bus (see bus.py).
+"""
+import sqlite3
+import threading
+import time
+
+class PresenceRegistry:
+    """Tracks which sids are editing which estimates"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._by_estimate = {}  # estimate id -> {sid: None}, kept in join order
+        self._by_sid = {}  # sid -> set of estimate ids
+        self._last_seen = {}  # sid -> clock value of its last event
+
+    def touch(self, sid):
+        """Record activity from a sid"""
+        with self._lock:
+            self._last_seen[sid] = self._clock()
+
+    def join(self, estimate_id, sid):
+        """Add a sid to an estimate, returning False if it was already there"""
+        with self._lock:
+            self._last_seen[sid] = self._clock()
+            editors = self._by_estimate.setdefault(estimate_id, {})
+            if sid in editors:
+                return False
+            editors[sid] = None
+            self._by_sid.setdefault(sid, set()).add(estimate_id)
+            return True
+
+    def leave(self, estimate_id, sid):
+        """Remove a sid from an estimate, returning False if it was not there"""
+        with self._lock:
+            return self._remove(estimate_id, sid)
+
+    def disconnect(self, sid):
+        """Forget a sid entirely and return the estimates it was editing"""
+        with self._lock:
+            return self._drop(sid)
+
+    def expire(self, timeout):
+        """Drop sids not seen for ``timeout`` seconds.
+
+        Returns a dict mapping each expired sid to the estimates it was
+        editing.
+        """
+        deadline = self._clock() - timeout
+        with self._lock:
+            stale = [sid for sid, seen in self._last_seen.items() if seen < deadline]
+            return {sid: self._drop(sid) for sid in stale}
+
+    def editors(self, estimate_id):
+        """Sids editing an estimate, in the order they joined"""
+        with self._lock:
+            return list(self._by_estimate.get(estimate_id, ()))
+
+    def estimates(self, sid):
+        """Estimates a sid is editing"""
+        with self._lock:
+            return sorted(self._by_sid.get(sid, ()))
+
+    def _remove(self, estimate_id, sid):
+        editors = self._by_estimate.get(estimate_id)
+        if not editors or sid not in editors:
+            return False
+        del editors[sid]
+        if not editors:
+            del self._by_estimate[estimate_id]
+        rooms = self._by_sid.get(sid)
+        if rooms is not None:
+            rooms.discard(estimate_id)
+            if not rooms:
+                del self._by_sid[sid]
+        return True
+
+    def _drop(self, sid):
+        self._last_seen.pop(sid, None)
+        estimate_ids = sorted(self._by_sid.get(sid, ()))
+        for estimate_id in estimate_ids:
+            self._remove(estimate_id, sid)
+        return estimate_ids
+
+class SQLitePresenceRegistry:
+    """Presence kept in a SQLite file so every worker process on a host shares it.
+
+    Offers the same methods as PresenceRegistry. Last-seen times are wall
+    clock times since workers do not share a monotonic clock, and touches of
+    the same sid are written at most once per ``touch_interval`` seconds.
+    """
+
+    def __init__(self, path, clock=time.time, touch_interval=1.0):
+        self.path = path
+        self._clock = clock
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._touched = {}  # sid -> clock value last written by this process
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS presence_sid (sid TEXT PRIMARY KEY, last_seen REAL)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS presence_editor ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, estimate_id TEXT, sid TEXT, '
+            'UNIQUE (estimate_id, sid))'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_presence_editor_sid ON presence_editor (sid)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _seen(self, conn, sid, now):
+        conn.execute(
+            'INSERT INTO presence_sid (sid, last_seen) VALUES (?, ?) '
+            'ON CONFLICT (sid) DO UPDATE SET last_seen = excluded.last_seen',
+            (sid, now)
+        )
+        with self._lock:
+            self._touched[sid] = now
+
+    def touch(self, sid):
+        """Record activity from a sid"""
+        now = self._clock()
+        with self._lock:
+            if now - self._touched.get(sid, float('-inf')) < self.touch_interval:
+                return
+        self._seen(self._connect(), sid, now)
+
+    def join(self, estimate_id, sid):
+        """Add a sid to an estimate, returning False if it was already there"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._seen(conn, sid, self._clock())
+            added = conn.execute(
+                'INSERT OR IGNORE INTO presence_editor (estimate_id, sid) VALUES (?, ?)',
+                (estimate_id, sid)
+            ).rowcount == 1
+            conn.execute('COMMIT')
+            return added
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def leave(self, estimate_id, sid):
+        """Remove a sid from an estimate, returning False if it was not there"""
+        return self._connect().execute(
+            'DELETE FROM presence_editor WHERE estimate_id = ? AND sid = ?', (estimate_id, sid)
+        ).rowcount == 1
+
+    def disconnect(self, sid):
+        """Forget a sid entirely and return the estimates it was editing"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            estimate_ids = self._drop(conn, sid)
+            conn.execute('COMMIT')
+            return estimate_ids
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def expire(self, timeout):
+        """Drop sids not seen for ``timeout`` seconds.
+
+        Returns a dict mapping each expired sid to the estimates it was
+        editing. Each stale sid is returned to exactly one worker.
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            stale = [row[0] for row in conn.execute(
+                'SELECT sid FROM presence_sid WHERE last_seen < ?', (self._clock() - timeout,)
+            ).fetchall()]
+            expired = {sid: self._drop(conn, sid) for sid in stale}
+            conn.execute('COMMIT')
+            return expired
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def editors(self, estimate_id):
+        """Sids editing an estimate, in the order they joined"""
+        return [row[0] for row in self._connect().execute(
+            'SELECT sid FROM presence_editor WHERE estimate_id = ? ORDER BY seq', (estimate_id,)
+        ).fetchall()]
+
+    def estimates(self, sid):
+        """Estimates a sid is editing"""
+        return [row[0] for row in self._connect().execute(
+            'SELECT estimate_id FROM presence_editor WHERE sid = ? ORDER BY estimate_id', (sid,)
+        ).fetchall()]
+
+    def _drop(self, conn, sid):
+        estimate_ids = [row[0] for row in conn.execute(
+            'SELECT estimate_id FROM presence_editor WHERE sid = ? ORDER BY estimate_id', (sid,)
+        ).fetchall()]
+        conn.execute('DELETE FROM presence_editor WHERE sid = ?', (sid,))
+        conn.execute('DELETE FROM presence_sid WHERE sid = ?', (sid,))
+        with self._lock:
+            self._touched.pop(sid, None)
+        return estimate_ids
+
+def make_registry(url):
+    """Build the registry named by a PRESENCE_URL"""
+    if url in ('', 'memory://'):
+        return PresenceRegistry()
+    if url.startswith('sqlite:///'):
+        return SQLitePresenceRegistry(url[len('sqlite:///'):])
+    raise ValueError(f'Unsupported PRESENCE_URL: {url}')
+
+class Presence:
+    """The registry configured for this process; in memory until ``init_app``"""
+
+    def __init__(self):
+        self.registry = PresenceRegistry()
+
+    def init_app(self, app):
+        self.registry = make_registry(app.config['PRESENCE_URL'])
+
+    def __getattr__(self, name):
+        return getattr(self.registry, name)
+
+# Shared by the Socket.IO handlers and the models of this process
+presence = Presence()
@@ -0,0 +1,189 @@
+# filepath: rollups.py
+"""Per-node and per-estimate personnel totals kept in the ``rollup`` table.
+
+Every node (and the estimate itself) has one rollup row per personnel type
+holding the sum of that type over its whole subtree. Granular edits adjust
+the rows on the path from the edited node to the estimate; full-tree saves
+recompute the estimate and write only the rows that changed. Totals that
+sum to zero are not stored.
+
+``flask rollups check`` recomputes every estimate from scratch and reports
+rows that drifted; ``--fix`` rewrites them.
+"""
+import click
+from collections import defaultdict
+from flask.cli import AppGroup
+from models import db, Estimate, Epic, Personnel, Rollup, NODE_MODELS, join_to_epic, personnel_union
+from cache import tree_cache
+
+# Level -> (parent foreign key column, parent level)
+PARENTS = {
+    'epic': ('estimate_id', 'estimate'),
+    'story': ('epic_id', 'epic'),
+    'task': ('story_id', 'story'),
+    'subtask': ('task_id', 'task')
+}
+
+# Rounding noise left by repeated float deltas
+EPSILON = 1e-9
+
+def compute_rollups(estimate_id):
+    """Recompute the rollups of an estimate from its personnel.
+
+    Returns a dict of (entity_type, entity_id, personnel type) to total.
+    """
+    parents = {}
+    for level, (parent_column, parent_level) in PARENTS.items():
+        model = NODE_MODELS[level]
+        rows = db.session.execute(join_to_epic(
+            db.select(model.id, getattr(model, parent_column)), model
+        ).where(Epic.estimate_id == estimate_id)).all()
+        for node_id, parent_id in rows:
+            parents[(level, node_id)] = (parent_level, parent_id)
+
+    totals = defaultdict(float)
+    rows = db.session.execute(personnel_union(
+        (Personnel.type, Personnel.value, Personnel.entity_type, Personnel.entity_id),
+        Epic.estimate_id == estimate_id
+    )).all()
+    for row in rows:
+        node = (row.entity_type, row.entity_id)
+        while node is not None:
+            totals[node + (row.type,)] += row.value or 0
+            node = parents.get(node)
+    return {key: total for key, total in totals.items() if abs(total) > EPSILON}
+
+def stored_rollups(estimate_id):
+    """The rollup rows currently stored for an estimate, keyed like ``compute_rollups``"""
+    rows = db.session.execute(
+        db.select(Rollup.entity_type, Rollup.entity_id, Rollup.type, Rollup.total)
+        .where(Rollup.estimate_id == estimate_id)
+    ).all()
+    return {(row.entity_type, row.entity_id, row.type): row.total for row in rows}
+
+def rollup_drift(expected, stored):
+    """Keys whose stored total differs from the expected one"""
+    return sorted(
+        key for key in set(expected) | set(stored)
+        if abs(expected.get(key, 0) - stored.get(key, 0)) > EPSILON
+    )
+
+def _write(estimate_id, stored, totals):
+    """Write ``totals`` over ``stored`` for the given keys. Returns row counts"""
+    inserts, updates, deletes = [], [], []
+    for key, total in totals.items():
+        entity_type, entity_id, personnel_type = key
+        row = {'entity_type': entity_type, 'entity_id': entity_id, 'type': personnel_type}
+        if abs(total) <= EPSILON:
+            if key in stored:
+                deletes.append(row)
+        elif key not in stored:
+            inserts.append(dict(row, estimate_id=estimate_id, total=total))
+        elif abs(stored[key] - total) > EPSILON:
+            updates.append(dict(row, total=total))
+
+    if inserts:
+        db.session.execute(db.insert(Rollup), inserts)
+    if updates:
+        db.session.execute(db.update(Rollup), updates)
+    if deletes:
+        table = Rollup.__table__
+        db.session.execute(table.delete().where(
+            table.c.entity_type == db.bindparam('b_entity_type'),
+            table.c.entity_id == db.bindparam('b_entity_id'),
+            table.c.type == db.bindparam('b_type')
+        ), [{f'b_{column}': value for column, value in row.items()} for row in deletes])
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes)}
+
+def sync_rollups(estimate_id):
+    """Bring the stored rollups of an estimate in line with its personnel.
+
+    Only rows whose total changed are written. Returns row counts. Does not
+    commit.
+    """
+    expected = compute_rollups(estimate_id)
+    stored = stored_rollups(estimate_id)
+    totals = {key: expected.get(key, 0) for key in rollup_drift(expected, stored)}
+    return _write(estimate_id, stored, totals)
+
+def node_path(entity_type, entity_id):
+    """The (entity_type, entity_id) pairs from a node up to its estimate, or None"""
+    levels = list(reversed(PARENTS))
+    levels = levels[levels.index(entity_type):]
+    model = NODE_MODELS[entity_type]
+    row = db.session.execute(join_to_epic(
+        db.select(*[NODE_MODELS[level].id for level in levels], Epic.estimate_id).select_from(model),
+        model
+    ).where(model.id == entity_id)).first()
+    if row is None:
+        return None
+    return list(zip(levels + ['estimate'], row))
+
+def apply_rollup_deltas(estimate_id, deltas):
+    """Add ``deltas`` to the stored rollups of an estimate.
+
+    ``deltas`` maps (entity_type, entity_id, personnel type) to the amount
+    to add. Does not commit.
+    """
+    deltas = {key: amount for key, amount in deltas.items() if amount}
+    if not deltas:
+        return
+    entity_ids = {key[1] for key in deltas}
+    rows = db.session.execute(
+        db.select(Rollup.entity_type, Rollup.entity_id, Rollup.type, Rollup.total)
+        .where(Rollup.estimate_id == estimate_id, Rollup.entity_id.in_(entity_ids))
+    ).all()
+    stored = {(row.entity_type, row.entity_id, row.type): row.total for row in rows}
+    _write(estimate_id, stored, {
+        key: stored.get(key, 0) + amount for key, amount in deltas.items()
+    })
+
+def path_deltas(path, personnel_type, amount, deltas=None):
+    """Accumulate ``amount`` of a personnel type onto every node of ``path``"""
+    deltas = deltas if deltas is not None else defaultdict(float)
+    for entity_type, entity_id in path:
+        deltas[(entity_type, entity_id, personnel_type)] += amount
+    return deltas
+
+rollups_cli = AppGroup('rollups', help='Maintain the personnel rollup table.')
+
+@rollups_cli.command('check')
+@click.option('--estimate', 'estimate_id', help='Only check this estimate.')
+@click.option('--fix', is_flag=True, help='Rewrite drifted rows.')
+def check_command(estimate_id, fix):
+    """Recompute rollups from scratch and report drift"""
+    if estimate_id:
+        estimate_ids = [estimate_id]
+    else:
+        estimate_ids = db.session.execute(db.select(Estimate.id).order_by(Estimate.id)).scalars().all()
+
+    drifted = 0
+    fixed = []
+    for current_id in estimate_ids:
+        expected = compute_rollups(current_id)
+        stored = stored_rollups(current_id)
+        keys = rollup_drift(expected, stored)
+        for entity_type, entity_id, personnel_type in keys:
+            key = (entity_type, entity_id, personnel_type)
+            click.echo(f'{current_id} {entity_type} {entity_id} {personnel_type}: '
+                       f'stored {stored.get(key, 0)} expected {expected.get(key, 0)}')
+        if keys:
+            drifted += 1
+            if fix:
+                fixed.append(current_id)
+                _write(current_id, stored, {key: expected.get(key, 0) for key in keys})
+                # Totals are part of the estimate's representation
+                db.session.execute(
+                    db.update(Estimate).where(Estimate.id == current_id)
+                    .values(version=Estimate.version + 1),
+                    execution_options={'synchronize_session': False}
+                )
+
+    if fix:
+        db.session.commit()
+        for current_id in fixed:
+            tree_cache.invalidate(current_id)
+    click.echo(f'{len(estimate_ids)} estimates checked, {drifted} with drift'
+               + (' (fixed)' if fix and drifted else ''))
+    if drifted and not fix:
+        raise SystemExit(1)
@@ -1,23 +1,349 @@
 # filepath: routes.py
-from flask import Blueprint, request, jsonify
-from models import db, Estimate, Epic, Story, Task, Subtask, Personnel, Draft
+from flask import Blueprint, request, jsonify, abort, current_app, stream_with_context
+from models import db, Estimate, Epic, Story, Task, Subtask, Personnel, Draft, DraftBlob, Rollup, load_estimate_tree, summarize_estimates
+from sqlalchemy import and_, or_
 from sqlalchemy.exc import SQLAlchemyError
-from datetime import datetime
+from datetime import date, datetime
+import base64
+import json
 import uuid
+from save_engine import save_estimate_tree, copy_estimate_tree
+from operations import apply_operations, OperationError
+from rollups import sync_rollups
+from schedule import parse_capacity, project_schedule
+from forecast import run_forecast, PERCENTILES
+from presence import presence
+from cache import tree_cache
+from instrumentation import profiler
+from oplog import operation_log
+from socket_metrics import socket_metrics
+from transfer import export_lines
 
 api_bp = Blueprint('api', __name__)
 
+# Rows fetched per round trip when streaming listings
+STREAM_BATCH_SIZE = 200
+
+def encode_cursor(sort_value, row_id):
+    """Encode the keyset position of a row as an opaque cursor"""
+    raw = json.dumps([sort_value.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(sort_value), row_id
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+def keyset_page(query, sort_column, id_column, descending=False):
+    """Order ``query`` by (sort_column, id_column) and restrict it to the page requested.
+
+    Reads the ``limit`` and ``cursor`` query parameters. Returns the page
+    query and the cursor of the next page (None on the last page); the
+    cursor comes from a two-row probe of the sort keys so the page itself
+    can be streamed. Raises ValueError for invalid parameters.
+    """
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column, id_column)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if descending:
+            query = query.where(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id)
+            ))
+        else:
+            query = query.where(or_(
+                sort_column > sort_value,
+                and_(sort_column == sort_value, id_column > row_id)
+            ))
+
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        return query, None
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+
+    # The last row of the page and the one after it, if any
+    probe = db.session.execute(
+        query.with_only_columns(sort_column, id_column).offset(limit - 1).limit(2)
+    ).all()
+    next_cursor = encode_cursor(*probe[0]) if len(probe) == 2 else None
+    return query.limit(limit), next_cursor
+
+def estimate_etag(version):
+    """Strong entity tag of an estimate version"""
+    return f'v{version}'
+
+def claim_version(estimate_id):
+    """Bump the version of an estimate for a write, honouring If-Match.
+
+    Returns the new version, or None when If-Match names a version that is
+    no longer current. The bump is a conditional UPDATE, so two writers
+    sending the same If-Match cannot both succeed.
+    """
+    version = db.session.execute(
+        db.select(Estimate.version).where(Estimate.id == estimate_id)
+    ).scalar()
+    statement = db.update(Estimate).where(Estimate.id == estimate_id)
+    if request.if_match:
+        if not request.if_match.contains(estimate_etag(version)):
+            return None
+        statement = statement.where(Estimate.version == version)
+    result = db.session.execute(
+        statement.values(version=Estimate.version + 1),
+        execution_options={'synchronize_session': False}
+    )
+    if result.rowcount == 0:
+        return None
+    return db.session.execute(
+        db.select(Estimate.version).where(Estimate.id == estimate_id)
+    ).scalar()
+
+def _body_number(data, key, default, kind=float):
+    """Return ``data[key]`` (or ``default``) as a number, raising ValueError for other types.
+
+    With ``kind=int`` only integers are accepted, so 1.5 is rejected rather
+    than truncated.
+    """
+    value = data.get(key, default)
+    if value is None:
+        return None
+    types = (int,) if kind is int else (int, float)
+    if isinstance(value, bool) or not isinstance(value, types):
+        raise ValueError(f"{key} must be {'an integer' if kind is int else 'a number'}")
+    return kind(value)
+
+def precondition_failed(estimate_id):
+    """412 response for a write based on a stale version of an estimate"""
+    db.session.rollback()
+    version = db.session.execute(
+        db.select(Estimate.version).where(Estimate.id == estimate_id)
+    ).scalar()
+    response = jsonify({'error': 'Estimate was modified by another write', 'version': version})
+    response.set_etag(estimate_etag(version))
+    return response, 412
+
+def encoded_response(body, gzipped):
+    """JSON response from an already encoded body, gzipped if the client accepts it"""
+    response = current_app.response_class(body, mimetype='application/json')
+    if gzipped is not None:
+        response.vary.add('Accept-Encoding')
+        if request.accept_encodings['gzip']:
+            response.set_data(gzipped)
+            response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def stream_rows(query, to_dicts):
+    """Generate a JSON array from ``query``, fetching rows in batches.
+
+    ``to_dicts`` turns a batch of rows into the dicts to emit, so memory
+    stays bounded by one batch whatever the size of the listing.
+    """
+    dumps = current_app.json.dumps
+    result = db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+    separator = '['
+    for rows in result.partitions():
+        for item in to_dicts(rows):
+            yield separator + dumps(item, separators=(',', ':'))
+            separator = ','
+    yield '[]\n' if separator == '[' else ']\n'
+
+def streamed_response(query, to_dicts, next_cursor):
+    """Streamed JSON array response carrying the next page cursor in X-Next-Cursor"""
+    response = current_app.response_class(
+        stream_with_context(stream_rows(query, to_dicts)), mimetype='application/json'
+    )
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@api_bp.route('/_metrics', methods=['GET'])
+def get_metrics():
+    """Per-endpoint percentiles of request time, DB time and query count"""
+    return jsonify(profiler.snapshot()), 200
+
 @api_bp.route('/estimates', methods=['GET'])
 def get_estimates():
-    """Get all estimates"""
-    estimates = Estimate.query.all()
-    return jsonify([estimate.to_dict() for estimate in estimates]), 200
+    """Get estimate summaries, ordered by creation time.
+
+    Query parameters:
+        is_draft: only return drafts ("true") or non-drafts ("false")
+        limit: page size; when given the cursor of the next page is sent in
+            the X-Next-Cursor header
+        cursor: value of X-Next-Cursor from the previous page
+        expand: "tree" returns full estimate trees instead of summaries
+    """
+    query = db.select(
+        Estimate.id, Estimate.project_name, Estimate.start_date,
+        Estimate.created_at, Estimate.is_draft, Estimate.version
+    )
+
+    is_draft = request.args.get('is_draft')
+    if is_draft is not None:
+        query = query.where(Estimate.is_draft == (is_draft.lower() in ('1', 'true', 'yes')))
+
+    try:
+        query, next_cursor = keyset_page(query, Estimate.created_at, Estimate.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('expand') == 'tree':
+        def to_dicts(rows):
+            return (load_estimate_tree(row.id) for row in rows)
+    else:
+        to_dicts = summarize_estimates
+    return streamed_response(query, to_dicts, next_cursor), 200
+
+@api_bp.route('/estimates/export', methods=['GET'])
+def export_estimates():
+    """Stream every estimate tree as NDJSON, one estimate per line.
+
+    Query parameters:
+        drafts: "true" adds the drafts of each estimate under ``drafts``
+    """
+    include_drafts = request.args.get('drafts', '').lower() in ('1', 'true', 'yes')
+    response = current_app.response_class(
+        stream_with_context(export_lines(include_drafts)), mimetype='application/x-ndjson'
+    )
+    response.headers['Content-Disposition'] = 'attachment; filename=estimates.ndjson'
+    return response, 200
 
 @api_bp.route('/estimates/<estimate_id>', methods=['GET'])
 def get_estimate(estimate_id):
-    """Get a specific estimate"""
-    estimate = Estimate.query.get_or_404(estimate_id)
-    return jsonify(estimate.to_dict()), 200
+    """Get a specific estimate, or 304 if If-None-Match names its current version"""
+    version = db.session.execute(
+        db.select(Estimate.version).where(Estimate.id == estimate_id)
+    ).scalar()
+    if version is None:
+        abort(404)
+    if request.if_none_match.contains_weak(estimate_etag(version)):
+        response = current_app.response_class(status=304)
+    else:
+        encoded = tree_cache.get(estimate_id, version, presence.editors(estimate_id))
+        if encoded is None:
+            tree = load_estimate_tree(estimate_id)
+            if tree is None:
+                abort(404)
+            version = tree['version']
+            encoded = tree_cache.put(estimate_id, version, tree['active_editors'], jsonify(tree).get_data())
+        response = encoded_response(*encoded)
+    response.set_etag(estimate_etag(version))
+    # Let browsers keep the body but revalidate it on every request
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@api_bp.route('/estimates/<estimate_id>/totals', methods=['GET'])
+def get_estimate_totals(estimate_id):
+    """Get the personnel totals of an estimate and of every node in it"""
+    Estimate.query.get_or_404(estimate_id)
+    rows = db.session.execute(
+        db.select(Rollup.entity_type, Rollup.entity_id, Rollup.type, Rollup.total)
+        .where(Rollup.estimate_id == estimate_id)
+    ).all()
+
+    totals = {}
+    nodes = {'epic': {}, 'story': {}, 'task': {}, 'subtask': {}}
+    for row in rows:
+        target = totals if row.entity_type == 'estimate' else nodes[row.entity_type].setdefault(row.entity_id, {})
+        target[row.type] = row.total
+    return jsonify({
+        'estimate_id': estimate_id,
+        'totals': totals,
+        'nodes': nodes
+    }), 200
+
+@api_bp.route('/estimates/<estimate_id>/schedule', methods=['GET'])
+def get_estimate_schedule(estimate_id):
+    """Project start and end dates for every node of an estimate.
+
+    Query parameters: ``capacity`` (people per role, e.g. ``DEV:3,BA:1``),
+    ``weekmask`` (working days, Monday first, e.g. ``1111100``),
+    ``holidays`` (comma separated ISO dates) and ``start`` (ISO date,
+    defaults to the estimate's start date).
+    """
+    tree = load_estimate_tree(estimate_id)
+    if tree is None:
+        abort(404)
+    config = current_app.config
+    holidays = request.args.get('holidays', config['SCHEDULE_HOLIDAYS'])
+    try:
+        schedule = project_schedule(
+            tree,
+            capacity=parse_capacity(request.args.get('capacity')),
+            default_capacity=config['SCHEDULE_DEFAULT_CAPACITY'],
+            weekmask=request.args.get('weekmask', config['SCHEDULE_WEEKMASK']),
+            holidays=[day.strip() for day in holidays.split(',') if day.strip()],
+            start=request.args.get('start')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(schedule), 200
+
+@api_bp.route('/estimates/<estimate_id>/forecast', methods=['POST'])
+def forecast_estimate(estimate_id):
+    """Run a Monte Carlo forecast of effort and completion dates.
+
+    Optional JSON body: ``trials``, ``distribution`` (``pert`` or
+    ``triangular``), ``low`` and ``high`` (the spread of each personnel value
+    as multipliers), ``seed``, ``workers``, ``percentiles`` and the calendar
+    settings of the schedule endpoint (``capacity``, ``weekmask``,
+    ``holidays``, ``start``).
+    """
+    tree = load_estimate_tree(estimate_id)
+    if tree is None:
+        abort(404)
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    config = current_app.config
+    holidays = data.get('holidays', config['SCHEDULE_HOLIDAYS'])
+    if isinstance(holidays, str):
+        holidays = [day.strip() for day in holidays.split(',') if day.strip()]
+    try:
+        trials = _body_number(data, 'trials', config['FORECAST_TRIALS'], int)
+        if trials > config['FORECAST_MAX_TRIALS']:
+            raise ValueError(f"trials must not exceed {config['FORECAST_MAX_TRIALS']}")
+        workers = _body_number(data, 'workers', 1, int)
+        if not 0 < workers <= config['FORECAST_MAX_WORKERS']:
+            raise ValueError(f"workers must be between 1 and {config['FORECAST_MAX_WORKERS']}")
+        percentiles = data.get('percentiles', list(PERCENTILES))
+        if not isinstance(percentiles, list) or not all(
+            isinstance(p, (int, float)) and not isinstance(p, bool) for p in percentiles
+        ):
+            raise ValueError('percentiles must be a list of numbers')
+        seed = _body_number(data, 'seed', None, int)
+        start = data.get('start')
+        if start is not None:
+            if not isinstance(start, str):
+                raise ValueError('start must be an ISO date string')
+            date.fromisoformat(start)
+        forecast = run_forecast(
+            tree,
+            trials=trials,
+            distribution=data.get('distribution', 'pert'),
+            low=_body_number(data, 'low', config['FORECAST_LOW']),
+            high=_body_number(data, 'high', config['FORECAST_HIGH']),
+            seed=seed,
+            workers=workers,
+            percentiles=percentiles,
+            capacity=parse_capacity(data.get('capacity')),
+            default_capacity=config['SCHEDULE_DEFAULT_CAPACITY'],
+            weekmask=data.get('weekmask', config['SCHEDULE_WEEKMASK']),
+            holidays=holidays,
+            start=start
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(forecast), 200
 
 @api_bp.route('/estimates', methods=['POST'])
 def create_estimate():
@@ -37,80 +363,105 @@ def create_estimate():
         if 'epics' in data:
             for epic_data in data['epics']:
                 create_epic(new_estimate.id, epic_data)
+            db.session.flush()
+            sync_rollups(new_estimate.id)
                 
         db.session.commit()
-        return jsonify(new_estimate.to_dict()), 201
+        response = jsonify(load_estimate_tree(new_estimate.id))
+        response.set_etag(estimate_etag(new_estimate.version))
+        return response, 201
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
 @api_bp.route('/estimates/<estimate_id>', methods=['PUT'])
 def update_estimate(estimate_id):
-    """Update an estimate"""
+    """Update an estimate, rejecting the write with 412 if If-Match is stale"""
     estimate = Estimate.query.get_or_404(estimate_id)
     data = request.json
     
     try:
-        with db.session.no_autoflush:
-            # Update basic fields
-            if 'project_name' in data:
-                estimate.project_name = data['project_name']
-            if 'start_date' in data:
-                estimate.start_date = datetime.fromisoformat(data['start_date'])
-            if 'is_draft' in data:
-                estimate.is_draft = data['is_draft']
-            
-            # Handle epics update if provided
-            if 'epics' in data:
-                # Get current epic IDs
-                current_epic_ids = {epic.id for epic in estimate.epics}
-                new_epic_ids = {epic['id'] for epic in data['epics'] if 'id' in epic}
-                
-                # Remove epics not in the new data
-                for epic_id in current_epic_ids - new_epic_ids:
-                    # First delete personnel associated with stories in this epic
-                    epic = Epic.query.get(epic_id)
-                    if epic:
-                        for story in epic.stories:
-                            # Delete personnel from tasks
-                            for task in story.tasks:
-                                # Delete personnel from subtasks
-                                for subtask in task.subTasks:
-                                    personnel_to_delete = Personnel.query.filter_by(entity_type='subtask', entity_id=subtask.id).all()
-                                    for p in personnel_to_delete:
-                                        db.session.delete(p)
-                                personnel_to_delete = Personnel.query.filter_by(entity_type='task', entity_id=task.id).all()
-                                for p in personnel_to_delete:
-                                    db.session.delete(p)
-                            personnel_to_delete = Personnel.query.filter_by(entity_type='story', entity_id=story.id).all()
-                            for p in personnel_to_delete:
-                                db.session.delete(p)
-                        # Now delete personnel for the epic itself
-                        personnel_to_delete = Personnel.query.filter_by(entity_type='epic', entity_id=epic_id).all()
-                        for p in personnel_to_delete:
-                            db.session.delete(p)
-                        db.session.flush()
-                        db.session.delete(epic)
-                
-                # Update or create epics
-                for epic_data in data['epics']:
-                    epic_id = epic_data.get('id')
-                    if epic_id and Epic.query.get(epic_id):
-                        update_epic(epic_id, epic_data)
-                    else:
-                        create_epic(estimate_id, epic_data)
-        
+        if claim_version(estimate_id) is None:
+            return precondition_failed(estimate_id)
+
+        # Update basic fields
+        if 'project_name' in data:
+            estimate.project_name = data['project_name']
+        if 'start_date' in data:
+            estimate.start_date = datetime.fromisoformat(data['start_date'])
+        if 'is_draft' in data:
+            estimate.is_draft = data['is_draft']
+
+        # Handle epics update if provided, writing only the rows that changed
+        stats = None
+        if 'epics' in data:
+            stats = save_estimate_tree(estimate_id, data['epics'])
+            current_app.logger.debug('Saved estimate %s: %s', estimate_id, stats)
+
         db.session.commit()
-        return jsonify(estimate.to_dict()), 200
+        tree_cache.invalidate(estimate_id)
+        tree = load_estimate_tree(estimate_id)
+        response = jsonify(tree)
+        response.set_etag(estimate_etag(tree['version']))
+        if stats is not None:
+            response.headers['X-Save-Stats'] = json.dumps(stats, separators=(',', ':'))
+        return response, 200
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+@api_bp.route('/estimates/<estimate_id>', methods=['PATCH'])
+def patch_estimate(estimate_id):
+    """Apply a batch of {type, action, data} operations to an estimate.
+
+    Rejected with 412 if If-Match names a stale version.
+    """
+    Estimate.query.get_or_404(estimate_id)
+    data = request.json
+    operations = data.get('operations') if isinstance(data, dict) else data
+
+    try:
+        version = claim_version(estimate_id)
+        if version is None:
+            return precondition_failed(estimate_id)
+        results = apply_operations(estimate_id, operations)
+        db.session.commit()
+        tree_cache.invalidate(estimate_id)
+        response = jsonify({'applied': len(results), 'results': results, 'version': version})
+        response.set_etag(estimate_etag(version))
+        return response, 200
+    except OperationError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'index': e.index}), 400
+    except SQLAlchemyError:
+        # The database error text is not meant for clients
+        db.session.rollback()
+        current_app.logger.exception('PATCH of estimate %s failed', estimate_id)
+        return jsonify({'error': 'Operations could not be applied'}), 400
+
 @api_bp.route('/estimates/<estimate_id>/drafts', methods=['GET'])
 def get_drafts(estimate_id):
-    """Get all drafts for an estimate"""
-    drafts = Draft.query.filter_by(estimate_id=estimate_id).all()
-    return jsonify([draft.to_dict() for draft in drafts]), 200
+    """Get draft metadata for an estimate, without the snapshots.
+
+    Query parameters:
+        order: "asc" (default) or "desc" by timestamp
+        limit, cursor: keyset pagination as for GET /estimates
+    """
+    query = db.select(
+        Draft.id, Draft.name, Draft.timestamp, Draft.estimate_id,
+        db.func.coalesce(DraftBlob.size, db.func.length(Draft.estimate_data)).label('size')
+    ).outerjoin(DraftBlob, Draft.blob_hash == DraftBlob.hash) \
+        .where(Draft.estimate_id == estimate_id)
+
+    try:
+        query, next_cursor = keyset_page(
+            query, Draft.timestamp, Draft.id,
+            descending=request.args.get('order') == 'desc'
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return streamed_response(query, lambda rows: map(Draft.summary_dict, rows), next_cursor), 200
 
 @api_bp.route('/estimates/<estimate_id>/drafts', methods=['POST'])
 def save_draft(estimate_id):
@@ -121,10 +472,19 @@ def save_draft(estimate_id):
     Estimate.query.get_or_404(estimate_id)
     
     try:
+        # Deltas are taken against the most recent draft of the estimate
+        max_depth = current_app.config['DRAFT_DELTA_MAX_DEPTH']
+        base = None
+        if max_depth:
+            latest = Draft.query.filter_by(estimate_id=estimate_id) \
+                .filter(Draft.blob_hash.isnot(None)) \
+                .order_by(Draft.timestamp.desc()).first()
+            base = latest.blob if latest else None
+        
         new_draft = Draft(
             name=data.get('name', f'Draft {datetime.now().isoformat()}'),
             estimate_id=estimate_id,
-            estimate_data=data['estimate_data']
+            blob=DraftBlob.store(data['estimate_data'], base=base, max_depth=max_depth)
         )
         db.session.add(new_draft)
         db.session.commit()
@@ -145,13 +505,124 @@ def delete_draft(estimate_id, draft_id):
     draft = Draft.query.filter_by(id=draft_id, estimate_id=estimate_id).first_or_404()
     
     try:
+        blob_hash = draft.blob_hash
         db.session.delete(draft)
+        db.session.flush()
+        # Snapshots are shared between drafts, so only drop unreferenced ones
+        DraftBlob.release(blob_hash)
         db.session.commit()
         return jsonify({"message": f"Draft {draft_id} deleted successfully"}), 200
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+@api_bp.route('/estimates/<estimate_id>/drafts/<draft_id>/restore', methods=['POST'])
+def restore_draft(estimate_id, draft_id):
+    """Replace an estimate with one of its drafts, without the client round-trip.
+
+    The stored snapshot is applied with the same row diff as a full PUT, in
+    one transaction, and rejected with 412 if If-Match is stale. Returns the
+    new version and the estimate summary; the estimate room is sent an
+    ``estimate_restored`` operation, which is also logged for rejoining
+    editors.
+    """
+    Estimate.query.get_or_404(estimate_id)
+    draft = Draft.query.filter_by(id=draft_id, estimate_id=estimate_id).first_or_404()
+
+    try:
+        # Drafts are saved by the frontend, so fields may be camelCase
+        snapshot = draft.get_estimate_data()
+        project_name = snapshot.get('project_name', snapshot.get('projectName'))
+        start_date = snapshot.get('start_date', snapshot.get('startDate'))
+        if not isinstance(snapshot.get('epics'), list):
+            return jsonify({'error': 'Draft has no epics to restore'}), 400
+
+        version = claim_version(estimate_id)
+        if version is None:
+            return precondition_failed(estimate_id)
+        values = {}
+        if project_name is not None:
+            values['project_name'] = project_name
+        if start_date:
+            values['start_date'] = datetime.fromisoformat(start_date)
+        if values:
+            db.session.execute(
+                db.update(Estimate).where(Estimate.id == estimate_id).values(**values),
+                execution_options={'synchronize_session': False}
+            )
+        stats = save_estimate_tree(estimate_id, snapshot['epics'])
+        db.session.commit()
+        tree_cache.invalidate(estimate_id)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+    operation = operation_log.append(estimate_id, {
+        'type': 'estimate',
+        'action': 'restore',
+        'data': {'draft_id': draft_id, 'version': version},
+        'client_id': None,
+        'timestamp': datetime.now().isoformat()
+    })
+    room = f"estimate_{estimate_id}"
+    socket_metrics.broadcast('estimate_restored', room)
+    current_app.extensions['socketio'].emit('estimate_restored', operation, room=room)
+
+    row = db.session.execute(db.select(
+        Estimate.id, Estimate.project_name, Estimate.start_date,
+        Estimate.created_at, Estimate.is_draft, Estimate.version
+    ).where(Estimate.id == estimate_id)).one()
+    response = jsonify({'version': version, 'estimate': summarize_estimates([row])[0]})
+    response.set_etag(estimate_etag(version))
+    response.headers['X-Save-Stats'] = json.dumps(stats, separators=(',', ':'))
+    return response, 200
+
+@api_bp.route('/estimates/<estimate_id>/clone', methods=['POST'])
+def clone_estimate(estimate_id):
+    """Copy an estimate with its whole hierarchy and personnel under fresh ids.
+
+    The body may set ``project_name``, ``start_date``, ``is_draft`` and
+    ``id`` of the copy; anything missing is taken from the source. Rows are
+    copied with bulk inserts in one transaction. Returns the summary of the
+    copy and the number of rows copied per table.
+    """
+    source = db.session.execute(db.select(
+        Estimate.project_name, Estimate.start_date, Estimate.is_draft
+    ).where(Estimate.id == estimate_id)).first()
+    if source is None:
+        abort(404)
+    data = request.get_json(silent=True) or {}
+
+    try:
+        start_date = data.get('start_date')
+        clone = Estimate(
+            project_name=data.get('project_name', source.project_name),
+            start_date=datetime.fromisoformat(start_date) if start_date else source.start_date,
+            is_draft=data.get('is_draft', source.is_draft),
+            id=data.get('id', str(uuid.uuid4()))
+        )
+        db.session.add(clone)
+        db.session.flush()
+        counts = copy_estimate_tree(estimate_id, clone.id)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+    row = db.session.execute(db.select(
+        Estimate.id, Estimate.project_name, Estimate.start_date,
+        Estimate.created_at, Estimate.is_draft, Estimate.version
+    ).where(Estimate.id == clone.id)).one()
+    response = jsonify({'estimate': summarize_estimates([row])[0], 'copied': counts})
+    response.set_etag(estimate_etag(row.version))
+    return response, 201
+
 # Helper functions to handle nested data
 def create_epic(estimate_id, epic_data):
     """Helper to create an epic with its relations"""
@@ -180,57 +651,6 @@ def create_epic(estimate_id, epic_data):
     
     return epic
 
-def update_epic(epic_id, epic_data):
-    """Helper to update an epic with its relations"""
-    epic = Epic.query.get(epic_id)
-    if not epic:
-        return None
-    
-    if 'name' in epic_data:
-        epic.name = epic_data['name']
-      # Update personnel
-    if 'personnel' in epic_data:
-        # First query and then delete to avoid SQLAlchemy's autoflush issues
-        personnel_to_delete = Personnel.query.filter_by(entity_type='epic', entity_id=epic_id).all()
-        for p in personnel_to_delete:
-            db.session.delete(p)
-        db.session.flush()  # Flush changes to ensure delete completes before adding new records
-        
-        # Add new personnel
-        for personnel_data in epic_data['personnel']:
-            personnel = Personnel(
-                type=personnel_data['type'],
-                value=personnel_data.get('value', 0),
-                entity_type='epic',
-                entity_id=epic_id
-            )
-            db.session.add(personnel)
-      # Handle stories update if provided
-    if 'stories' in epic_data:
-        # Get current story IDs
-        current_story_ids = {story.id for story in epic.stories}
-        new_story_ids = {story.get('id') for story in epic_data['stories'] if 'id' in story}
-          # Remove stories not in the new data
-        for story_id in current_story_ids - new_story_ids:
-            story = Story.query.get(story_id)
-            if story:
-                # Delete associated personnel records first to avoid integrity issues
-                personnel_to_delete = Personnel.query.filter_by(entity_type='story', entity_id=story_id).all()
-                for p in personnel_to_delete:
-                    db.session.delete(p)
-                db.session.flush()
-                db.session.delete(story)
-        
-        # Update or create stories
-        for story_data in epic_data['stories']:
-            story_id = story_data.get('id')
-            if story_id and Story.query.get(story_id):
-                update_story(story_id, story_data)
-            else:
-                create_story(epic_id, story_data)
-    
-    return epic
-
 def create_story(epic_id, story_data):
     """Helper to create a story with its relations"""
     story = Story(
@@ -258,56 +678,6 @@ def create_story(epic_id, story_data):
     
     return story
 
-def update_story(story_id, story_data):
-    """Helper to update a story with its relations"""
-    story = Story.query.get(story_id)
-    if not story:
-        return None
-    
-    if 'name' in story_data:
-        story.name = story_data['name']    # Update personnel
-    if 'personnel' in story_data:
-        # First query and then delete to avoid SQLAlchemy's autoflush issues
-        personnel_to_delete = Personnel.query.filter_by(entity_type='story', entity_id=story_id).all()
-        for p in personnel_to_delete:
-            db.session.delete(p)
-        db.session.flush()  # Flush changes to ensure delete completes before adding new records
-        
-        # Add new personnel
-        for personnel_data in story_data['personnel']:
-            personnel = Personnel(
-                type=personnel_data['type'],
-                value=personnel_data.get('value', 0),
-                entity_type='story',
-                entity_id=story_id
-            )
-            db.session.add(personnel)
-      # Handle tasks update if provided
-    if 'tasks' in story_data:
-        # Get current task IDs
-        current_task_ids = {task.id for task in story.tasks}
-        new_task_ids = {task.get('id') for task in story_data['tasks'] if 'id' in task}
-          # Remove tasks not in the new data
-        for task_id in current_task_ids - new_task_ids:
-            task = Task.query.get(task_id)
-            if task:
-                # Delete associated personnel records first to avoid integrity issues
-                personnel_to_delete = Personnel.query.filter_by(entity_type='task', entity_id=task_id).all()
-                for p in personnel_to_delete:
-                    db.session.delete(p)
-                db.session.flush()
-                db.session.delete(task)
-        
-        # Update or create tasks
-        for task_data in story_data['tasks']:
-            task_id = task_data.get('id')
-            if task_id and Task.query.get(task_id):
-                update_task(task_id, task_data)
-            else:
-                create_task(story_id, task_data)
-    
-    return story
-
 def create_task(story_id, task_data):
     """Helper to create a task with its relations"""
     task = Task(
@@ -334,54 +704,6 @@ def create_task(story_id, task_data):
     
     return task
 
-def update_task(task_id, task_data):
-    """Helper to update a task with its relations"""
-    task = Task.query.get(task_id)
-    if not task:
-        return None
-    
-    if 'name' in task_data:
-        task.name = task_data['name']      # Update personnel
-    if 'personnel' in task_data:
-        # First query and then delete to avoid SQLAlchemy's autoflush issues
-        personnel_to_delete = Personnel.query.filter_by(entity_type='task', entity_id=task_id).all()
-        for p in personnel_to_delete:
-            db.session.delete(p)
-        db.session.flush()  # Flush changes to ensure delete completes before adding new records
-        
-        # Add new personnel
-        for personnel_data in task_data['personnel']:
-            personnel = Personnel(
-                type=personnel_data['type'],
-                value=personnel_data.get('value', 0),
-                entity_type='task',
-                entity_id=task_id
-            )
-            db.session.add(personnel)
-      # Handle subTasks update if provided
-    if 'subTasks' in task_data:
-        # Get current subtask IDs
-        current_subtask_ids = {subtask.id for subtask in task.subTasks}
-        new_subtask_ids = {subtask.get('id') for subtask in task_data['subTasks'] if 'id' in subtask}          # Remove subTasks not in the new data
-        for subtask_id in current_subtask_ids - new_subtask_ids:
-            subtask = Subtask.query.get(subtask_id)
-            if subtask:
-                # Delete associated personnel records first to avoid integrity issues
-                personnel_to_delete = Personnel.query.filter_by(entity_type='subtask', entity_id=subtask_id).all()
-                for p in personnel_to_delete:
-                    db.session.delete(p)
-                db.session.flush()
-                db.session.delete(subtask)
-          # Update or create subTasks
-        for subtask_data in task_data['subTasks']:
-            subtask_id = subtask_data.get('id')
-            if subtask_id and Subtask.query.get(subtask_id):
-                update_subtask(subtask_id, subtask_data)
-            else:
-                create_subtask(task_id, subtask_data)
-    
-    return task
-
 def create_subtask(task_id, subtask_data):
     """Helper to create a subtask with its relations"""
     subtask = Subtask(
@@ -402,31 +724,4 @@ def create_subtask(task_id, subtask_data):
             )
             db.session.add(personnel)
     
-    return subtask
-
-def update_subtask(subtask_id, subtask_data):
-    """Helper to update a subtask with its relations"""
-    subtask = Subtask.query.get(subtask_id)
-    if not subtask:
-        return None
-    
-    if 'name' in subtask_data:
-        subtask.name = subtask_data['name']      # Update personnel
-    if 'personnel' in subtask_data:
-        # First query and then delete to avoid SQLAlchemy's autoflush issues
-        personnel_to_delete = Personnel.query.filter_by(entity_type='subtask', entity_id=subtask_id).all()
-        for p in personnel_to_delete:
-            db.session.delete(p)
-        db.session.flush()  # Flush changes to ensure delete completes before adding new records
-        
-        # Add new personnel
-        for personnel_data in subtask_data['personnel']:
-            personnel = Personnel(
-                type=personnel_data['type'],
-                value=personnel_data.get('value', 0),
-                entity_type='subtask',
-                entity_id=subtask_id
-            )
-            db.session.add(personnel)
-    
     return subtask
\ No newline at end of file
@@ -0,0 +1,325 @@
+# filepath: save_engine.py
+"""Diff-based persistence of full estimate trees.
+
+The current hierarchy of an estimate is read once, compared in memory with an
+incoming payload keyed by node id, and only the rows that actually differ are
+written back with bulk INSERT/UPDATE/DELETE statements.
+"""
+import uuid
+from collections import defaultdict
+from models import db, Epic, Personnel, Rollup, NODE_MODELS, join_to_epic, personnel_union
+from rollups import sync_rollups
+
+# Level name -> (parent foreign key column, payload key holding the children, child level)
+LEVELS = {
+    'epic': ('estimate_id', 'stories', 'story'),
+    'story': ('epic_id', 'tasks', 'task'),
+    'task': ('story_id', 'subTasks', 'subtask'),
+    'subtask': ('task_id', None, None)
+}
+
+# Keep IN (...) lists well below the bind parameter limits of SQLite
+CHUNK_SIZE = 500
+
+def _empty_stats():
+    """Zeroed row counters for every table the engine writes to"""
+    return {
+        kind: {'inserted': 0, 'updated': 0, 'deleted': 0}
+        for kind in list(NODE_MODELS) + ['personnel']
+    }
+
+def personnel_row(entity_type, entity_id, personnel_data):
+    """Insertable personnel row for a payload entry attached to a node"""
+    return {
+        'id': str(uuid.uuid4()),
+        'type': personnel_data['type'],
+        'value': personnel_data.get('value', 0),
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        f'{entity_type}_id': entity_id
+    }
+
+def flatten_nodes(level, parent_id, items, rows=None):
+    """Turn nested payload nodes into insertable rows grouped per table.
+
+    Nodes keep their ``id`` when the payload has one. Returns a dict of
+    level (plus ``'personnel'``) to lists of row dicts.
+    """
+    rows = rows if rows is not None else defaultdict(list)
+    parent_column, children_key, child_level = LEVELS[level]
+    for item in items:
+        node_id = item.get('id') or str(uuid.uuid4())
+        rows[level].append({
+            'id': node_id,
+            'name': item.get('name', ''),
+            parent_column: parent_id
+        })
+        for personnel_data in item.get('personnel', []):
+            rows['personnel'].append(personnel_row(level, node_id, personnel_data))
+        if children_key:
+            flatten_nodes(child_level, node_id, item.get(children_key, []), rows)
+    return rows
+
+def insert_rows(rows):
+    """Bulk insert rows grouped per table, parents first. Returns counts per table"""
+    counts = {}
+    for level in list(LEVELS) + ['personnel']:
+        model = Personnel if level == 'personnel' else NODE_MODELS[level]
+        if rows.get(level):
+            db.session.execute(db.insert(model), rows[level])
+        counts[level] = len(rows.get(level, ()))
+    return counts
+
+def delete_subtrees(level, ids):
+    """Delete the nodes of ``level`` selected by ``ids`` with all descendants.
+
+    ``ids`` is a select of node ids; descendants, personnel and rollups are
+    removed with one set-based DELETE per table. Ancestor rollups are left
+    to the caller. Returns counts per table.
+    """
+    selects = {level: ids}
+    current = level
+    while LEVELS[current][2]:
+        child_level = LEVELS[current][2]
+        model = NODE_MODELS[child_level]
+        parent_column = getattr(model, LEVELS[child_level][0])
+        selects[child_level] = db.select(model.id).where(parent_column.in_(selects[current]))
+        current = child_level
+
+    counts = {'personnel': 0}
+    options = {'synchronize_session': False}
+    for entity_type, node_ids in selects.items():
+        result = db.session.execute(db.delete(Personnel).where(
+            Personnel.entity_type == entity_type,
+            Personnel.entity_id.in_(node_ids)
+        ), execution_options=options)
+        counts['personnel'] += result.rowcount
+        db.session.execute(db.delete(Rollup).where(
+            Rollup.entity_type == entity_type,
+            Rollup.entity_id.in_(node_ids)
+        ), execution_options=options)
+    for entity_type in reversed(list(selects)):
+        model = NODE_MODELS[entity_type]
+        result = db.session.execute(
+            db.delete(model).where(model.id.in_(selects[entity_type])),
+            execution_options=options
+        )
+        counts[entity_type] = result.rowcount
+    return counts
+
+class EstimateTreeDiff:
+    """Pending row changes for one estimate, grouped per table"""
+
+    def __init__(self, estimate_id):
+        self.estimate_id = estimate_id
+        self.nodes = {}
+        self.personnel = defaultdict(list)
+        self.inserts = defaultdict(list)
+        self.updates = defaultdict(list)
+        self.deletes = defaultdict(list)
+        self.seen = defaultdict(set)
+        self.replaced_children = defaultdict(set)
+
+    def load(self):
+        """Read the current hierarchy and personnel of the estimate as plain rows"""
+        for level, (parent_column, _, _) in LEVELS.items():
+            model = NODE_MODELS[level]
+            rows = db.session.execute(join_to_epic(
+                db.select(model.id, model.name, getattr(model, parent_column).label('parent_id')),
+                model
+            ).where(Epic.estimate_id == self.estimate_id)).all()
+            self.nodes[level] = {row.id: row for row in rows}
+
+        rows = db.session.execute(personnel_union(
+            (Personnel.id, Personnel.type, Personnel.value,
+             Personnel.entity_type, Personnel.entity_id),
+            Epic.estimate_id == self.estimate_id
+        )).all()
+        for row in rows:
+            self.personnel[(row.entity_type, row.entity_id)].append(row)
+
+    def diff(self, epics):
+        """Compare the payload list of epics with the loaded tree"""
+        self._diff_nodes('epic', self.estimate_id, epics)
+        self._collect_deletes()
+
+    def _diff_nodes(self, level, parent_id, items):
+        parent_column, children_key, child_level = LEVELS[level]
+        self.replaced_children[level].add(parent_id)
+
+        for item in items:
+            node_id = item.get('id')
+            current = self.nodes[level].get(node_id)
+            if current is None:
+                node_id = node_id or str(uuid.uuid4())
+                self.inserts[level].append({
+                    'id': node_id,
+                    'name': item.get('name', ''),
+                    parent_column: parent_id
+                })
+            else:
+                changes = {}
+                if 'name' in item and item['name'] != current.name:
+                    changes['name'] = item['name']
+                if current.parent_id != parent_id:
+                    changes[parent_column] = parent_id
+                if changes:
+                    self.updates[level].append(dict(changes, id=node_id))
+            self.seen[level].add(node_id)
+
+            if 'personnel' in item:
+                self._diff_personnel(level, node_id, item['personnel'])
+            if children_key and children_key in item:
+                self._diff_nodes(child_level, node_id, item[children_key])
+
+    def _diff_personnel(self, entity_type, entity_id, items):
+        """Match incoming personnel to existing rows by id, then by type in order"""
+        existing = list(self.personnel.get((entity_type, entity_id), []))
+        by_id = {row.id: row for row in existing}
+        unmatched = []
+
+        for personnel_data in items:
+            row = by_id.pop(personnel_data.get('id'), None)
+            if row is not None:
+                existing.remove(row)
+                self._update_personnel(row, personnel_data)
+            else:
+                unmatched.append(personnel_data)
+
+        for personnel_data in unmatched:
+            row = next((r for r in existing if r.type == personnel_data['type']), None)
+            if row is not None:
+                existing.remove(row)
+                self._update_personnel(row, personnel_data)
+            else:
+                self.inserts['personnel'].append(personnel_row(entity_type, entity_id, personnel_data))
+
+        self.deletes['personnel'].extend(row.id for row in existing)
+
+    def _update_personnel(self, row, personnel_data):
+        """Queue an update for a matched personnel row if its type or value changed"""
+        changes = {}
+        if personnel_data['type'] != row.type:
+            changes['type'] = personnel_data['type']
+        value = personnel_data.get('value', 0)
+        if value != row.value:
+            changes['value'] = value
+        if changes:
+            self.updates['personnel'].append(dict(changes, id=row.id))
+
+    def _collect_deletes(self):
+        """Delete nodes dropped from a replaced child list, and everything below them"""
+        deleted_parents = set()
+        for level in LEVELS:
+            deleted = [
+                node_id for node_id, row in self.nodes[level].items()
+                if node_id not in self.seen[level] and (
+                    row.parent_id in deleted_parents
+                    or row.parent_id in self.replaced_children[level]
+                )
+            ]
+            self.deletes[level] = deleted
+            for node_id in deleted:
+                self.deletes['personnel'].extend(
+                    row.id for row in self.personnel.get((level, node_id), [])
+                )
+            deleted_parents = set(deleted)
+
+    def apply(self):
+        """Write the pending changes and return per-table row counts"""
+        stats = _empty_stats()
+
+        # Parents are inserted before children and deleted after them
+        for level, count in insert_rows(self.inserts).items():
+            stats[level]['inserted'] = count
+
+        for level in list(LEVELS) + ['personnel']:
+            model = Personnel if level == 'personnel' else NODE_MODELS[level]
+            # Bulk UPDATE by primary key batches rows that change the same columns
+            batches = defaultdict(list)
+            for row in self.updates[level]:
+                batches[tuple(sorted(row))].append(row)
+            for rows in batches.values():
+                db.session.execute(db.update(model), rows)
+            stats[level]['updated'] = len(self.updates[level])
+
+        for level in ['personnel'] + list(reversed(LEVELS)):
+            model = Personnel if level == 'personnel' else NODE_MODELS[level]
+            ids = self.deletes[level]
+            for start in range(0, len(ids), CHUNK_SIZE):
+                db.session.execute(
+                    db.delete(model).where(model.id.in_(ids[start:start + CHUNK_SIZE])),
+                    execution_options={'synchronize_session': False}
+                )
+            stats[level]['deleted'] = len(ids)
+
+        return stats
+
+def save_estimate_tree(estimate_id, epics):
+    """Bring the stored hierarchy of an estimate in line with a payload of epics.
+
+    Follows the semantics of a full-tree PUT: nodes missing from a provided
+    child list are deleted along with their descendants and personnel, nodes
+    without a known id are created, and a node whose ``personnel`` or child
+    key is absent keeps what it has. Rollups are re-synced afterwards.
+    Returns the number of rows inserted, updated and deleted per table.
+    Does not commit.
+    """
+    tree_diff = EstimateTreeDiff(estimate_id)
+    tree_diff.load()
+    tree_diff.diff(epics)
+    stats = tree_diff.apply()
+    stats['rollup'] = sync_rollups(estimate_id)
+    return stats
+
+def copy_estimate_tree(source_id, target_id):
+    """Copy the hierarchy, personnel and rollups of one estimate onto another.
+
+    Every copied row gets a fresh id. The source is read with one select per
+    table and the copies are written with one bulk INSERT per table, so the
+    statement count does not depend on the size of the tree. The target
+    estimate row must already exist and should have no hierarchy of its own.
+    Returns the number of rows copied per table. Does not commit.
+    """
+    new_ids = {source_id: target_id}
+    rows = defaultdict(list)
+    for level, model in NODE_MODELS.items():
+        parent_column = LEVELS[level][0]
+        parent = getattr(model, parent_column)
+        query = db.select(model.id, model.name, parent)
+        if model is not Epic:
+            query = join_to_epic(query, model)
+        for row in db.session.execute(query.where(Epic.estimate_id == source_id)):
+            new_ids[row.id] = str(uuid.uuid4())
+            rows[level].append({
+                'id': new_ids[row.id],
+                'name': row.name,
+                parent_column: new_ids[row[2]]
+            })
+
+    for row in db.session.execute(personnel_union(
+        (Personnel.type, Personnel.value, Personnel.entity_type, Personnel.entity_id),
+        Epic.estimate_id == source_id
+    )):
+        rows['personnel'].append(personnel_row(row.entity_type, new_ids[row.entity_id], row._mapping))
+    counts = insert_rows(rows)
+
+    # Totals do not depend on ids, so the source rollups stay valid for the copy
+    rollup_rows = [
+        {
+            'entity_type': row.entity_type,
+            'entity_id': new_ids[row.entity_id],
+            'type': row.type,
+            'estimate_id': target_id,
+            'total': row.total
+        }
+        for row in db.session.execute(
+            db.select(Rollup.entity_type, Rollup.entity_id, Rollup.type, Rollup.total)
+            .where(Rollup.estimate_id == source_id)
+        )
+        if row.entity_id in new_ids
+    ]
+    if rollup_rows:
+        db.session.execute(db.insert(Rollup), rollup_rows)
+    counts['rollup'] = len(rollup_rows)
+    return counts
@@ -0,0 +1,156 @@
+# filepath: schedule.py
+"""Projection of an estimate's personnel effort onto a working-day calendar.
+
+Personnel values are read as person-days of effort per role. Each role is a
+pipeline with a capacity in people that works through the nodes of the tree
+in display order (depth first), all roles progressing in parallel. A node's
+own work spans from the earliest start to the latest finish of its roles;
+every node is then given the span of its whole subtree.
+
+The tree is flattened into an effort matrix (nodes x roles) and the
+projection is a handful of NumPy array operations: a cumulative sum per
+role, segment min/max reductions over the contiguous depth-first range of
+each subtree, and one business-day offset call per date column.
+"""
+import numpy as np
+from save_engine import LEVELS
+
+def parse_capacity(value):
+    """Parse ``DEV:3,BA:1.5``, or a dict of the same, into a dict of role to people"""
+    if isinstance(value, dict):
+        items = list(value.items())
+        for role, people in items:
+            if isinstance(people, bool) or not isinstance(people, (int, float)):
+                raise ValueError(f'capacity of {role} must be a number')
+    elif value is not None and not isinstance(value, str):
+        raise ValueError('capacity must be a string such as DEV:3,BA:1 or an object of role to people')
+    else:
+        items = []
+        for item in filter(None, (part.strip() for part in (value or '').split(','))):
+            role, sep, people = item.partition(':')
+            if not sep or not role:
+                raise ValueError(f'invalid capacity {item!r}, expected ROLE:PEOPLE')
+            items.append((role, people))
+
+    capacity = {}
+    for role, people in items:
+        capacity[role] = float(people)
+        if not capacity[role] > 0:
+            raise ValueError(f'capacity of {role} must be positive')
+    return capacity
+
+def flatten_tree(tree):
+    """Flatten an estimate tree into depth-first rows.
+
+    Returns ``(nodes, last, efforts)``: ``nodes`` is a list of (level, node
+    dict, parent id), ``last[i]`` is the index of the last node in the
+    subtree of node ``i``, and ``efforts`` holds three parallel lists of
+    node index, personnel type and value.
+    """
+    nodes, last = [], []
+    indexes, types, values = [], [], []
+
+    def visit(level, node, parent_id):
+        index = len(nodes)
+        nodes.append((level, node, parent_id))
+        last.append(index)
+        for p in node['personnel']:
+            indexes.append(index)
+            types.append(p['type'])
+            values.append(p['value'] or 0)
+        _, children_key, child_level = LEVELS[level]
+        if children_key:
+            for child in node.get(children_key, []):
+                visit(child_level, child, node['id'])
+        last[index] = len(nodes) - 1
+
+    for epic in tree['epics']:
+        visit('epic', epic, tree['id'])
+    return nodes, last, (indexes, types, values)
+
+def working_calendar(start, weekmask='1111100', holidays=()):
+    """Return the business-day calendar and its first working day on or after ``start``"""
+    calendar = np.busdaycalendar(weekmask=weekmask, holidays=list(holidays))
+    origin = np.busday_offset(np.datetime64(start, 'D'), 0, roll='forward', busdaycal=calendar)
+    return calendar, origin
+
+def project_schedule(tree, capacity=None, default_capacity=1.0, weekmask='1111100', holidays=(), start=None):
+    """Compute start and end dates for every node of an estimate tree.
+
+    ``tree`` is the dict returned by ``load_estimate_tree``. ``capacity``
+    maps roles to people, falling back to ``default_capacity``. Dates are
+    working days under ``weekmask`` (Monday first) and ``holidays``;
+    scheduling starts on ``start`` or the estimate's start date. Nodes
+    without any effort get no dates. Raises ValueError on a bad calendar.
+    """
+    capacity = capacity or {}
+    if not default_capacity > 0:
+        raise ValueError('default capacity must be positive')
+    calendar, origin = working_calendar(start or tree['start_date'], weekmask, holidays)
+
+    nodes, last, (indexes, types, values) = flatten_tree(tree)
+    roles = sorted(set(types))
+    role_index = {role: i for i, role in enumerate(roles)}
+    role_columns = np.array([role_index[t] for t in types], dtype=int)
+
+    # Effort matrix, one row per node in depth-first order
+    effort = np.bincount(
+        np.array(indexes, dtype=int) * len(roles) + role_columns,
+        weights=np.array(values, dtype=float),
+        minlength=len(nodes) * len(roles)
+    ).reshape(len(nodes), len(roles))
+    people = np.array([capacity.get(role, default_capacity) for role in roles])
+
+    # Each role's pipeline: working days per node, finishing cumulatively
+    days = np.clip(effort, 0, None) / people
+    finish = np.cumsum(days, axis=0)
+    busy = days > 0
+    own_start = np.where(busy, finish - days, np.inf).min(axis=1, initial=np.inf)
+    own_end = np.where(busy, finish, -np.inf).max(axis=1, initial=-np.inf)
+
+    # Subtrees are contiguous depth-first ranges [i, last[i]]; reduceat over
+    # interleaved (start, stop) bounds reduces each range, the odd results
+    # are discarded. A sentinel keeps stop == len(nodes) a valid index.
+    bounds = np.empty(2 * len(nodes), dtype=int)
+    bounds[0::2] = np.arange(len(nodes))
+    bounds[1::2] = np.array(last, dtype=int) + 1
+    if len(nodes):
+        span_start = np.minimum.reduceat(np.append(own_start, np.inf), bounds)[0::2]
+        span_end = np.maximum.reduceat(np.append(own_end, -np.inf), bounds)[0::2]
+    else:
+        span_start = span_end = np.zeros(0)
+
+    scheduled = np.isfinite(span_start)
+    # Drop float noise so whole days do not spill into the next one
+    span_start = np.round(span_start, 6)
+    span_end = np.round(span_end, 6)
+    first_day = np.floor(np.where(scheduled, span_start, 0)).astype(int)
+    # A span ending exactly on a day boundary finishes on the previous day
+    last_day = np.maximum(np.ceil(np.where(scheduled, span_end, 0)).astype(int) - 1, first_day)
+    start_dates = np.busday_offset(origin, first_day, busdaycal=calendar).astype(str).tolist()
+    end_dates = np.busday_offset(origin, last_day, busdaycal=calendar).astype(str).tolist()
+    durations = np.round(np.where(scheduled, span_end - span_start, 0), 2).tolist()
+    scheduled = scheduled.tolist()
+
+    schedule = [{
+        'type': level,
+        'id': node['id'],
+        'name': node['name'],
+        'parent_id': parent_id,
+        'start': start_dates[i] if scheduled[i] else None,
+        'end': end_dates[i] if scheduled[i] else None,
+        'working_days': durations[i]
+    } for i, (level, node, parent_id) in enumerate(nodes)]
+
+    # Every role pipeline starts at day zero, so the estimate ends with the slowest one
+    total = round(float(finish[-1].max()), 6) if len(nodes) and len(roles) else 0.0
+    end = np.busday_offset(origin, max(int(np.ceil(total)) - 1, 0), busdaycal=calendar)
+    return {
+        'estimate_id': tree['id'],
+        'start': str(origin),
+        'end': str(end) if total > 0 else None,
+        'working_days': round(total, 2),
+        'capacity': {role: float(people[i]) for i, role in enumerate(roles)},
+        'weekmask': weekmask,
+        'nodes': schedule
+    }
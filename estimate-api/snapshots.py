@@ -0,0 +1,53 @@
+# filepath: snapshots.py
+"""Encoding of estimate snapshots stored with drafts.
+
+Snapshots are serialized canonically (sorted keys, one JSON token per line)
+so identical estimates always produce identical text and hash, and so
+consecutive drafts of the same estimate can be stored as line deltas.
+"""
+import difflib
+import hashlib
+import json
+import zlib
+
+def canonical(data):
+    """Canonical JSON text of a snapshot"""
+    return json.dumps(data, sort_keys=True, indent=0, separators=(',', ':'))
+
+def content_hash(text):
+    """Content address of a canonical snapshot"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def compress(text):
+    return zlib.compress(text.encode('utf-8'), 6)
+
+def decompress(blob):
+    return zlib.decompress(blob).decode('utf-8')
+
+def line_delta(base_text, text):
+    """Describe ``text`` as line ranges copied from ``base_text`` plus new lines.
+
+    The result is a list whose items are either ``[start, end]`` (copy base
+    lines start..end) or a list of strings (insert these lines).
+    """
+    base_lines = base_text.split('\n')
+    lines = text.split('\n')
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(lines[j1:j2])
+    return ops
+
+def apply_delta(base_text, ops):
+    """Rebuild the text described by ``line_delta``"""
+    base_lines = base_text.split('\n')
+    lines = []
+    for op in ops:
+        if op and isinstance(op[0], int):
+            lines.extend(base_lines[op[0]:op[1]])
+        else:
+            lines.extend(op)
+    return '\n'.join(lines)
@@ -0,0 +1,209 @@
+# filepath: socket_metrics.py
+"""Metrics of the Socket.IO collaboration layer in Prometheus text format.
+
+Handlers are wrapped with ``track`` to count their events and observe their
+latency and payload size; every room emit reports its fan-out (the number of
+sids it is delivered to in this process). Connected clients are counted on
+connect and disconnect, while room sizes are read from the Socket.IO manager
+when ``/metrics`` is scraped.
+
+The exposition is written by hand to avoid a client library dependency;
+metrics are per process, like the rest of the real-time state.
+"""
+import bisect
+import functools
+import json
+import threading
+import time
+from flask import g, has_app_context
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Estimate rooms, as named by the handlers
+ROOM_PREFIX = 'estimate_'
+
+def payload_size(data):
+    """Size of an event payload encoded as JSON, computed once per event"""
+    cached = g.get('socket_payload') if has_app_context() else None
+    if cached is not None and cached[0] is data:
+        return cached[1]
+    try:
+        size = len(json.dumps(data, separators=(',', ':')).encode())
+    except (TypeError, ValueError):
+        size = 0
+    if has_app_context():
+        g.socket_payload = (data, size)
+    return size
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + ','.join(pairs) + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        if not self.labels and not self._values:
+            yield self.name, '', 0
+        for labels, value in sorted(self._values.items()):
+            yield self.name, _labels(self.labels, labels), value
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+class Histogram:
+    """Cumulative histogram over fixed upper bounds, optionally split by labels"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [per-bucket counts (+Inf last), sum]
+
+    def observe(self, value, *labels):
+        series = self._series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def reset(self):
+        self._series = {}
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       _labels(self.labels + ('le',), labels + (_number(bound),)), cumulative)
+            yield f'{self.name}_sum', _labels(self.labels, labels), total
+            yield f'{self.name}_count', _labels(self.labels, labels), cumulative
+
+class SocketMetrics:
+    """Counters and histograms of the Socket.IO handlers of this process"""
+
+    def __init__(self):
+        self.socketio = None
+        self._lock = threading.Lock()
+        self.connected = Gauge('socketio_connected_clients', 'Clients currently connected.')
+        self.connections = Counter('socketio_connections_total', 'Client connections accepted.')
+        self.disconnections = Counter('socketio_disconnections_total', 'Client disconnections.')
+        self.events = Counter('socketio_events_received_total', 'Events received by type.', ['event'])
+        self.latency = Histogram('socketio_handler_duration_seconds', 'Handler latency by event.',
+                                 LATENCY_BUCKETS, ['event'])
+        self.payload = Histogram('socketio_event_payload_bytes', 'Size of received payloads as JSON.',
+                                 BYTES_BUCKETS, ['event'])
+        self.fanout = Histogram('socketio_broadcast_fanout', 'Recipients per room emit by event.',
+                                COUNT_BUCKETS, ['event'])
+        self.rejected = Counter('socketio_events_rejected_total',
+                                'Events refused by admission control, by event and reason.',
+                                ['event', 'reason'])
+        self.deliveries = Counter('socketio_broadcast_deliveries_total',
+                                  'Messages delivered by room emits, by event.', ['event'])
+        self.rooms = Gauge('socketio_rooms', 'Estimate rooms with at least one sid.')
+        self.room_size = Histogram('socketio_room_size', 'Sids per estimate room at scrape time.',
+                                   COUNT_BUCKETS)
+        self.largest_room = Gauge('socketio_room_size_max', 'Sids in the largest estimate room.')
+        self._metrics = [
+            self.connected, self.connections, self.disconnections, self.events, self.rejected,
+            self.latency, self.payload, self.fanout, self.deliveries, self.rooms, self.room_size, self.largest_room
+        ]
+
+    def init_app(self, socketio):
+        self.socketio = socketio
+
+    def client_connected(self):
+        with self._lock:
+            self.connections.inc()
+            self.connected.inc()
+
+    def client_disconnected(self):
+        with self._lock:
+            self.disconnections.inc()
+            self.connected.inc(amount=-1)
+
+    def track(self, event):
+        """Decorator counting a handler's events, payload bytes and latency"""
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return handler(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - started
+                    size = payload_size(args[0]) if args else 0
+                    with self._lock:
+                        self.events.inc(event)
+                        self.latency.observe(elapsed, event)
+                        self.payload.observe(size, event)
+            return wrapper
+        return decorator
+
+    def reject(self, event, reason):
+        """Count an event refused by admission control"""
+        with self._lock:
+            self.rejected.inc(event, reason)
+
+    def _participants(self, room):
+        if self.socketio is None or self.socketio.server is None:
+            return []
+        return [sid for sid, _ in self.socketio.server.manager.get_participants('/', room)]
+
+    def broadcast(self, event, room, skip_sid=None):
+        """Record the fan-out of an emit to ``room``; call it just before emitting"""
+        recipients = sum(1 for sid in self._participants(room) if sid != skip_sid)
+        with self._lock:
+            self.fanout.observe(recipients, event)
+            self.deliveries.inc(event, amount=recipients)
+
+    def _room_sizes(self):
+        if self.socketio is None or self.socketio.server is None:
+            return []
+        # Every sid also sits in a room named after itself; only estimate rooms count
+        rooms = self.socketio.server.manager.rooms.get('/', {})
+        return [len(sids) for room, sids in list(rooms.items())
+                if isinstance(room, str) and room.startswith(ROOM_PREFIX) and len(sids)]
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        sizes = self._room_sizes()
+        lines = []
+        with self._lock:
+            self.rooms.set(len(sizes))
+            self.largest_room.set(max(sizes, default=0))
+            self.room_size.reset()
+            for size in sizes:
+                self.room_size.observe(size)
+            for metric in self._metrics:
+                lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                for name, labels, value in metric.samples():
+                    lines.append(f'{name}{labels} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+# Shared by the Socket.IO handlers and the broadcaster of this process
+socket_metrics = SocketMetrics()
@@ -0,0 +1,39 @@
+# filepath: tests/conftest.py
+import os
+import sys
+import tempfile
+import pytest
+
+# The app reads its configuration at import time, so point it at a scratch database first
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp(prefix='estimate-api-tests-')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_db_dir, "test.db")}'
+
+from app import app as flask_app
+from database import db
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def estimate_id(client):
+    """Id of a small estimate with personnel on one epic"""
+    response = client.post('/api/estimates', json={
+        'project_name': 'Forecast',
+        'start_date': '2026-01-05',
+        'epics': [{
+            'name': 'Epic',
+            'personnel': [{'type': 'DEV', 'value': 5}, {'type': 'BA', 'value': 2}]
+        }]
+    })
+    assert response.status_code == 201
+    return response.get_json()['id']
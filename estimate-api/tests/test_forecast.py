@@ -0,0 +1,42 @@
+# filepath: tests/test_forecast.py
+import pytest
+
+def forecast(client, estimate_id, body):
+    return client.post(f'/api/estimates/{estimate_id}/forecast', json=body)
+
+def test_forecast_accepts_valid_body(client, estimate_id):
+    response = forecast(client, estimate_id, {
+        'trials': 200, 'seed': 1, 'start': '2026-02-02',
+        'percentiles': [50, 90], 'capacity': {'DEV': 2}
+    })
+    assert response.status_code == 200
+    assert response.get_json()['seed'] == 1
+
+def test_forecast_accepts_empty_body(client, estimate_id):
+    response = client.post(f'/api/estimates/{estimate_id}/forecast')
+    assert response.status_code == 200
+
+@pytest.mark.parametrize('body', [[1, 2], 5, 'trials', True])
+def test_forecast_rejects_non_object_body(client, estimate_id, body):
+    response = forecast(client, estimate_id, body)
+    assert response.status_code == 400
+    assert 'JSON object' in response.get_json()['error']
+
+@pytest.mark.parametrize('body', [
+    {'capacity': [1]},
+    {'capacity': 5},
+    {'capacity': {'DEV': 'many'}},
+    {'start': 5},
+    {'start': 'next week'},
+    {'seed': 1.5},
+    {'seed': '7'},
+    {'trials': 100.5},
+    {'workers': True},
+    {'low': '0.5'},
+    {'percentiles': '95'},
+    {'percentiles': {'95': 1}},
+])
+def test_forecast_rejects_malformed_fields(client, estimate_id, body):
+    response = forecast(client, estimate_id, dict(body, trials=body.get('trials', 200)))
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,35 @@
+# filepath: tests/test_models.py
+from sqlalchemy import event
+from database import db
+from models import Estimate, load_estimate_tree
+
+def test_to_dict_reads_rollups_once(client, estimate_id):
+    client.patch(f'/api/estimates/{estimate_id}', json={'operations': [
+        {'type': 'story', 'action': 'add', 'data': {
+            'epic_id': client.get(f'/api/estimates/{estimate_id}').get_json()['epics'][0]['id'],
+            'name': 'Story',
+            'personnel': [{'type': 'DEV', 'value': 3}],
+            'tasks': [{'name': 'Task', 'subTasks': [{'name': 'Subtask', 'personnel': [{'type': 'BA', 'value': 1}]}]}]
+        }}
+    ]})
+    db.session.expire_all()
+    estimate = db.session.get(Estimate, estimate_id)
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        tree = estimate.to_dict()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert sum('FROM rollup' in statement for statement in statements) == 1
+    expected = load_estimate_tree(estimate_id)
+    assert tree['totals'] == expected['totals'] == {'DEV': 8, 'BA': 3}
+    story = tree['epics'][0]['stories'][0]
+    assert story['totals'] == expected['epics'][0]['stories'][0]['totals']
+    assert story['tasks'][0]['subTasks'][0]['totals'] == {'BA': 1}
+
+def test_node_to_dict_without_totals(client, estimate_id):
+    estimate = db.session.get(Estimate, estimate_id)
+    assert estimate.epics[0].to_dict()['totals'] == {'DEV': 5, 'BA': 2}
@@ -0,0 +1,46 @@
+# filepath: tests/test_operations.py
+import pytest
+
+def patch(client, estimate_id, operation):
+    return client.patch(f'/api/estimates/{estimate_id}', json={'operations': [operation]})
+
+@pytest.fixture
+def epic_id(client, estimate_id):
+    return client.get(f'/api/estimates/{estimate_id}').get_json()['epics'][0]['id']
+
+@pytest.mark.parametrize('name', [None, 5, ['x']])
+def test_node_update_rejects_invalid_name(client, estimate_id, epic_id, name):
+    response = patch(client, estimate_id, {'type': 'epic', 'action': 'update', 'data': {'id': epic_id, 'name': name}})
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 0
+
+def test_node_add_rejects_invalid_nested_name(client, estimate_id, epic_id):
+    response = patch(client, estimate_id, {'type': 'story', 'action': 'add', 'data': {
+        'epic_id': epic_id, 'name': 'Story', 'tasks': [{'name': None}]
+    }})
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 0
+
+@pytest.mark.parametrize('value', [None, 5, {'x': 1}])
+def test_project_name_update_rejects_non_strings(client, estimate_id, value):
+    response = patch(client, estimate_id, {'type': 'project_name', 'action': 'update', 'data': {'value': value}})
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 0
+
+@pytest.mark.parametrize('personnel', [{'value': 1}, {'type': 'DEV', 'value': 'abc'}, {'type': 'DEV', 'value': None}])
+def test_node_add_rejects_invalid_personnel(client, estimate_id, personnel):
+    response = patch(client, estimate_id, {'type': 'epic', 'action': 'add', 'data': {
+        'name': 'Epic', 'personnel': [personnel]
+    }})
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 0
+
+def test_valid_updates_are_applied(client, estimate_id, epic_id):
+    response = client.patch(f'/api/estimates/{estimate_id}', json={'operations': [
+        {'type': 'epic', 'action': 'update', 'data': {'id': epic_id, 'name': 'Renamed'}},
+        {'type': 'project_name', 'action': 'update', 'data': {'value': 'Project'}}
+    ]})
+    assert response.status_code == 200
+    estimate = client.get(f'/api/estimates/{estimate_id}').get_json()
+    assert estimate['project_name'] == 'Project'
+    assert estimate['epics'][0]['name'] == 'Renamed'
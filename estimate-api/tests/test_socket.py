@@ -0,0 +1,18 @@
+# filepath: tests/test_socket.py
+from app import socketio
+from presence import presence
+
+def test_join_unknown_estimate_is_rejected(app):
+    client = socketio.test_client(app)
+    ack = client.emit('join_estimate', {'estimate_id': 'no-such-estimate'}, callback=True)
+    assert ack['error'] == 'estimate_not_found'
+    rejected = [event for event in client.get_received() if event['name'] == 'event_rejected']
+    assert rejected[0]['args'][0]['reason'] == 'estimate_not_found'
+    assert not presence.editors('no-such-estimate')
+    client.disconnect()
+
+def test_join_existing_estimate(app, estimate_id):
+    client = socketio.test_client(app)
+    ack = client.emit('join_estimate', {'estimate_id': estimate_id}, callback=True)
+    assert ack == {'seq': 0}
+    client.disconnect()
@@ -0,0 +1,241 @@
+# filepath: transfer.py
+"""NDJSON export and import of whole estimates.
+
+The export has one line per estimate, ordered by creation time: the tree as
+returned by ``GET /estimates/<id>`` (without ``active_editors``), plus its
+drafts under ``drafts`` when asked for. Estimates are read one at a time, so
+memory stays flat whatever the size of the database.
+
+    flask estimates export [--drafts] [-o estimates.ndjson]
+    flask estimates import estimates.ndjson [--batch-size 100]
+
+The import keeps estimate, node and draft ids and commits every batch of
+estimates in its own transaction, writing each table with one bulk INSERT
+per batch. Estimates whose id already exists are skipped, so an import that
+stopped part way can simply be run again. A batch that fails is retried one
+estimate at a time; estimates that still fail are reported by line number
+and left out. Rollups are computed from the imported personnel, and
+personnel get fresh ids.
+"""
+import datetime
+import json
+import sys
+import time
+import uuid
+import click
+from collections import defaultdict
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Estimate, Draft, DraftBlob, Rollup, load_estimate_tree
+from save_engine import flatten_nodes, insert_rows
+from rollups import PARENTS, EPSILON
+
+# Estimate ids fetched per round trip while exporting
+EXPORT_BATCH_SIZE = 200
+
+def export_lines(include_drafts=False):
+    """Generate one NDJSON line per estimate, oldest first"""
+    dumps = current_app.json.dumps
+    result = db.session.execute(
+        db.select(Estimate.id).order_by(Estimate.created_at, Estimate.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for estimate_id in result.scalars():
+        tree = load_estimate_tree(estimate_id)
+        if tree is None:
+            continue  # deleted since the listing was read
+        tree.pop('active_editors', None)
+        if include_drafts:
+            tree['drafts'] = [{
+                'id': draft.id,
+                'name': draft.name,
+                'timestamp': draft.timestamp.isoformat(),
+                'estimate': draft.get_estimate_data()
+            } for draft in Draft.query.filter_by(estimate_id=estimate_id)
+                .order_by(Draft.timestamp, Draft.id)]
+        yield dumps(tree, separators=(',', ':')) + '\n'
+
+def _rollup_rows(estimate_id, rows):
+    """Rollup rows of an estimate from its flattened node and personnel rows"""
+    parents = {}
+    for level, (parent_column, parent_level) in PARENTS.items():
+        for row in rows.get(level, ()):
+            parents[(level, row['id'])] = (parent_level, row[parent_column])
+
+    totals = defaultdict(float)
+    for row in rows.get('personnel', ()):
+        node = (row['entity_type'], row['entity_id'])
+        while node is not None:
+            totals[node + (row['type'],)] += row['value'] or 0
+            node = parents.get(node)
+    return [
+        {'entity_type': entity_type, 'entity_id': entity_id, 'type': personnel_type,
+         'estimate_id': estimate_id, 'total': total}
+        for (entity_type, entity_id, personnel_type), total in totals.items()
+        if abs(total) > EPSILON
+    ]
+
+def _estimate_rows(data, rows):
+    """Add the rows of one exported estimate to ``rows``. Returns its drafts"""
+    estimate_id = data['id']
+    created_at = data.get('created_at')
+    rows['estimate'].append({
+        'id': estimate_id,
+        'project_name': data.get('project_name', 'New Project'),
+        'start_date': datetime.datetime.fromisoformat(data['start_date']),
+        'created_at': datetime.datetime.fromisoformat(created_at) if created_at else datetime.datetime.utcnow(),
+        'is_draft': data.get('is_draft', True)
+    })
+    tree_rows = flatten_nodes('epic', estimate_id, data.get('epics', []))
+    for table, table_rows in tree_rows.items():
+        rows[table].extend(table_rows)
+    rows['rollup'].extend(_rollup_rows(estimate_id, tree_rows))
+    return [dict(draft, estimate_id=estimate_id) for draft in data.get('drafts', [])]
+
+def _write_batch(batch):
+    """Insert a batch of (line number, estimate) pairs in one transaction.
+
+    Returns the number of rows inserted per table. Rolls back and re-raises
+    on failure.
+    """
+    rows = defaultdict(list)
+    drafts = []
+    for _, data in batch:
+        drafts.extend(_estimate_rows(data, rows))
+    try:
+        db.session.execute(db.insert(Estimate), rows['estimate'])
+        counts = insert_rows(rows)
+        if rows['rollup']:
+            db.session.execute(db.insert(Rollup), rows['rollup'])
+        for draft_data in drafts:
+            draft = Draft(
+                name=draft_data.get('name', 'Imported draft'),
+                estimate_id=draft_data['estimate_id'],
+                id=draft_data.get('id'),
+                blob=DraftBlob.store(draft_data['estimate'])
+            )
+            if draft_data.get('timestamp'):
+                draft.timestamp = datetime.datetime.fromisoformat(draft_data['timestamp'])
+            db.session.add(draft)
+            # Blobs are deduplicated by looking them up, so make them visible
+            db.session.flush()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    counts['estimate'] = len(rows['estimate'])
+    counts['rollup'] = len(rows['rollup'])
+    counts['draft'] = len(drafts)
+    return counts
+
+def _parse_lines(lines):
+    """Yield (line number, estimate) for every non-blank line, or (line number, error)"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict) or not isinstance(data.get('epics', []), list):
+                raise ValueError('expected an estimate object')
+            data.setdefault('id', str(uuid.uuid4()))
+            if not isinstance(data['id'], str) or not data['id']:
+                raise ValueError(f"invalid estimate id {data['id']!r}")
+            yield number, data
+        except ValueError as e:
+            yield number, e
+
+def import_lines(lines, batch_size=100, progress=None):
+    """Import estimates from NDJSON lines in batched transactions.
+
+    ``progress`` is called with the running totals after every batch.
+    Returns the totals: estimates imported and skipped, failures as
+    (line number, error) pairs, rows inserted per table, and throughput.
+    """
+    totals = {'imported': 0, 'skipped': 0, 'failed': [], 'rows': defaultdict(int), 'seconds': 0.0}
+    started = time.perf_counter()
+
+    def write(batch):
+        if not batch:
+            return
+        # Already imported by an earlier run, or repeated within the file
+        known = set(db.session.execute(
+            db.select(Estimate.id).where(Estimate.id.in_([data['id'] for _, data in batch]))
+        ).scalars())
+        pending = []
+        for number, data in batch:
+            if data['id'] in known:
+                totals['skipped'] += 1
+            else:
+                known.add(data['id'])
+                pending.append((number, data))
+        try:
+            written = [(pending, _write_batch(pending))] if pending else []
+        except (SQLAlchemyError, ValueError, KeyError, TypeError):
+            # Find the estimates that broke the batch and keep the others
+            written = []
+            for item in pending:
+                try:
+                    written.append(([item], _write_batch([item])))
+                except (SQLAlchemyError, ValueError, KeyError, TypeError) as e:
+                    totals['failed'].append((item[0], f'{type(e).__name__}: {e}'))
+        for items, counts in written:
+            totals['imported'] += len(items)
+            for table, count in counts.items():
+                totals['rows'][table] += count
+        totals['seconds'] = time.perf_counter() - started
+        if progress:
+            progress(totals)
+
+    batch = []
+    for number, data in _parse_lines(lines):
+        if isinstance(data, Exception):
+            totals['failed'].append((number, f'{type(data).__name__}: {data}'))
+            continue
+        batch.append((number, data))
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = []
+    write(batch)
+
+    totals['seconds'] = time.perf_counter() - started
+    totals['rows'] = dict(totals['rows'])
+    return totals
+
+def throughput(totals):
+    """Human readable progress line for import totals"""
+    seconds = totals['seconds'] or 1e-9
+    rows = sum(totals['rows'].values())
+    return (f"{totals['imported']} imported, {totals['skipped']} skipped, {len(totals['failed'])} failed, "
+            f"{rows} rows in {totals['seconds']:.1f}s "
+            f"({totals['imported'] / seconds:.1f} estimates/s, {rows / seconds:.0f} rows/s)")
+
+estimates_cli = AppGroup('estimates', help='Export and import estimates as NDJSON.')
+
+@estimates_cli.command('export')
+@click.option('--drafts', is_flag=True, help='Include the drafts of every estimate.')
+@click.option('-o', '--output', type=click.File('w'), default='-', help='File to write (default stdout).')
+def export_command(drafts, output):
+    """Write every estimate as one line of NDJSON"""
+    started = time.perf_counter()
+    count = 0
+    for line in export_lines(drafts):
+        output.write(line)
+        count += 1
+    seconds = time.perf_counter() - started
+    click.echo(f'{count} estimates exported in {seconds:.1f}s '
+               f'({count / (seconds or 1e-9):.1f} estimates/s)', err=True)
+
+@estimates_cli.command('import')
+@click.argument('source', type=click.File('r'))
+@click.option('--batch-size', type=click.IntRange(min=1), default=100, show_default=True,
+              help='Estimates committed per transaction.')
+def import_command(source, batch_size):
+    """Import estimates from NDJSON, skipping ids that already exist"""
+    totals = import_lines(source, batch_size, progress=lambda totals: click.echo(throughput(totals), err=True))
+    for number, error in totals['failed']:
+        click.echo(f'line {number}: {error}', err=True)
+    summary = dict(totals, failed=len(totals['failed']), seconds=round(totals['seconds'], 3))
+    click.echo(json.dumps(summary, sort_keys=True))
+    if totals['failed']:
+        sys.exit(1)
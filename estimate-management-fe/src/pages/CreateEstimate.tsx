@@ -54,6 +54,11 @@ const CreateEstimate: React.FC = () => {
     // Join the estimate room
     socketRef.current.emit("join_estimate", { estimate_id: id });
 
+    // Keep our presence alive while the page is open but idle
+    const heartbeat = setInterval(() => {
+      socketRef.current?.emit("heartbeat");
+    }, 30000);
+
     // Set up event handlers
     socketRef.current.on("editor_joined", (data: any) => {
       console.log(`Editor joined: ${data.client_id}`);
@@ -70,6 +75,13 @@ const CreateEstimate: React.FC = () => {
       handleIncomingUpdate(data);
     });
 
+    socketRef.current.on("estimate_updated_batch", (batch: any) => {
+      // Coalesced updates include our own, so skip those
+      batch.updates
+        .filter((data: any) => data.client_id !== socketRef.current?.id)
+        .forEach(handleIncomingUpdate);
+    });
+
     // Fetch estimate data from API
     const fetchEstimate = async () => {
       try {
@@ -124,6 +136,7 @@ const CreateEstimate: React.FC = () => {
 
     // Cleanup on unmount
     return () => {
+      clearInterval(heartbeat);
       if (socketRef.current) {
         socketRef.current.emit("leave_estimate", { estimate_id: id });
         socketRef.current.disconnect();
@@ -108,14 +108,14 @@ const Home: React.FC = () => {
               </div>
               <div className="mt-4">
                 <span className="text-sm">
-                  {estimate.epics.length} Epic
-                  {estimate.epics.length !== 1 ? "s" : ""}
+                  {estimate.epic_count} Epic
+                  {estimate.epic_count !== 1 ? "s" : ""}
                 </span>
                 <div className="w-full bg-gray-200 rounded-full h-1.5 mt-1">
                   <div
                     className="bg-blue-600 h-1.5 rounded-full"
                     style={{
-                      width: `${estimate.epics.length > 0 ? "100%" : "0%"}`,
+                      width: `${estimate.epic_count > 0 ? "100%" : "0%"}`,
                     }}
                   ></div>
                 </div>